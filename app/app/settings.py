@@ -37,15 +37,17 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework.authtoken",
-    "core",
-    "user",
-    'recipe',
+    "core.apps.CoreConfig",
+    "user.apps.UserConfig",
+    "recipe.apps.RecipeConfig",
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.db.router.ReplicaMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -56,6 +58,11 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "app.urls"
 
+# serve the API reads with core.async_views, only for app.asgi since
+# the views would need an event loop per request under WSGI, they pay
+# off with spare cores and a database on another host
+ASYNC_VIEWS = os.environ.get("DJANGO_ASYNC_VIEWS", "") == "1"
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -82,15 +89,103 @@ DATABASES = {
     "default": {
         # "ENGINE": "django.db.backends.sqlite3",
         # "NAME": BASE_DIR / "db.sqlite3",
-        "ENGINE": "django.db.backends.postgresql",
+        # django.db.backends.postgresql with health checks and a pool
+        "ENGINE": "core.db",
         # theose infomations are setting on docker-compose
         "HOST": os.environ.get("DB_HOST"),
         "NAME": os.environ.get("DB_NAME"),
         "USER": os.environ.get("DB_USER"),
         "PASSWORD": os.environ.get("DB_PASS"),
+        # seconds a connection is kept for the next requests of its
+        # thread, or of every thread with a pool, 0 closes it after
+        # every request
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+        # check a kept connection with SELECT 1 before reusing it
+        "HEALTH_CHECKS": os.environ.get("DB_HEALTH_CHECKS", "1") == "1",
+        # connections shared by the threads of a process, see core.db
+        "POOL_SIZE": int(os.environ.get("DB_POOL_SIZE", 0)),
+        "POOL_TIMEOUT": float(os.environ.get("DB_POOL_TIMEOUT", 10)),
     }
 }
 
+# read-only standbys of the default database, the reads of GET, HEAD
+# and OPTIONS requests go to them in turn, see core.db.router
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.environ.get("DB_REPLICA_HOSTS", "").split(","))
+):
+    DATABASE_REPLICAS.append(f"replica{index + 1}")
+    DATABASES[f"replica{index + 1}"] = dict(
+        DATABASES["default"], HOST=host.strip(), TEST={"MIRROR": "default"}
+    )
+
+DATABASE_ROUTERS = ["core.db.router.ReplicaRouter"]
+
+# a client reads from the default database for this many seconds after
+# it wrote, remembered in this cache which has to be shared by every
+# worker when there are replicas
+DATABASE_REPLICA_STICKY_SECONDS = float(
+    os.environ.get("DB_REPLICA_STICKY_SECONDS", 10)
+)
+DATABASE_REPLICA_STICKY_CACHE = "api_responses"
+# a replica further behind in seconds or not answering is skipped
+# until it is checked again
+DATABASE_REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", 5))
+DATABASE_REPLICA_CHECK_INTERVAL = float(
+    os.environ.get("DB_REPLICA_CHECK_INTERVAL", 5)
+)
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # token key -> user lookups of user.authentication, checked against
+    # the user's version in auth_versions
+    # the in-process cache drops the least recently used tokens
+    # once it is full and every token after the timeout (seconds)
+    "auth_tokens": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "auth-tokens",
+        "TIMEOUT": int(os.environ.get("AUTH_TOKEN_CACHE_TTL", 300)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", 10000)),
+        },
+    },
+    # list responses of the recipe API, see recipe.cache
+    "api_responses": {
+        "locmem": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "api-responses",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        },
+        # shared by every worker on the host
+        "file": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get(
+                "API_RESPONSE_CACHE_DIR", "/tmp/api-responses"
+            ),
+        },
+        # shared by every host, needs manage.py createcachetable
+        "db": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "api_response_cache",
+        },
+    }[os.environ.get("API_RESPONSE_CACHE", "locmem")],
+}
+# versions of the users' credentials of user.authentication, changed
+# when a user is saved so every worker drops its cached tokens
+CACHES["auth_versions"] = dict(CACHES["api_responses"], KEY_PREFIX="auth")
+# a worker reads a user's version from auth_versions at most once in
+# this many seconds, changes made by other workers take up to this long
+# to stop its cached tokens, writes are always checked in the database
+AUTH_VERSION_CHECK_INTERVAL = float(
+    os.environ.get("AUTH_VERSION_CHECK_INTERVAL", 5)
+)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -128,6 +223,46 @@ MEDIA_URL = "/media/"
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# resized copies of uploaded recipe images, see recipe.images
+# sizes are the longest side in pixels, formats are Pillow formats
+RECIPE_IMAGE_SIZES = (128, 512, 1024)
+RECIPE_IMAGE_FORMATS = ("webp", "jpeg")
+# worker processes decoding and resizing the uploads
+RECIPE_IMAGE_WORKERS = int(os.environ.get("RECIPE_IMAGE_WORKERS", 2))
+# limits of uploaded recipe images, see recipe.uploads
+RECIPE_IMAGE_MAX_BYTES = int(
+    os.environ.get("RECIPE_IMAGE_MAX_BYTES", 10 * 2 ** 20)
+)
+RECIPE_IMAGE_MAX_PIXELS = int(
+    os.environ.get("RECIPE_IMAGE_MAX_PIXELS", 40000000)
+)
+# uploads are streamed here, it has to be on the same file system as
+# MEDIA_ROOT so storing the image is a rename
+RECIPE_IMAGE_UPLOAD_DIR = os.path.join(MEDIA_ROOT, "tmp")
+# widths recipe images are resized to on request for srcset, the copies
+# are kept under MEDIA_ROOT/resized up to a total size
+RECIPE_IMAGE_WIDTHS = (160, 320, 480, 640, 800, 1024, 1280, 1600, 1920)
+RECIPE_IMAGE_CACHE_MAX_BYTES = int(
+    os.environ.get("RECIPE_IMAGE_CACHE_MAX_BYTES", 2 ** 30)
+)
+# remove a replaced or deleted recipe image and its copies once the
+# change is committed, manage.py prune_images removes the rest
+RECIPE_IMAGE_DELETE_ON_COMMIT = (
+    os.environ.get("RECIPE_IMAGE_DELETE_ON_COMMIT", "") == "1"
+)
+
+# how recipe.media serves MEDIA_URL:
+# "django" streams the files from the worker with range support,
+# "accel" hands them to nginx with X-Accel-Redirect to an internal
+# location at MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT,
+# "sendfile" hands them to Apache or lighttpd with X-Sendfile
+MEDIA_SERVE_MODE = os.environ.get("MEDIA_SERVE_MODE", "django")
+MEDIA_ACCEL_PREFIX = os.environ.get("MEDIA_ACCEL_PREFIX", "/internal-media/")
+# only serve images to the owners of the recipes using them
+MEDIA_PRIVATE = os.environ.get("MEDIA_PRIVATE", "") == "1"
+# media names never change content so clients may cache them for good
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
 # set the string to core.User
 # core is out app name
 # User is the model name
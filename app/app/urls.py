@@ -13,14 +13,30 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
-from django.conf.urls.static import static
+from django.urls import path, include, re_path
 from django.conf import settings
 
+from recipe.media import MediaView, ResizedImageView
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/user/", include("user.urls")),
     path('api/recipe/', include('recipe.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # uploaded images, handed off to the proxy in production, see
+    # MEDIA_SERVE_MODE
+    re_path(
+        rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}'
+        r'recipe/(?P<pk>\d+)/w/(?P<width>\d+)$',
+        ResizedImageView.as_view(),
+        name='recipe-image-width'
+    ),
+    re_path(
+        rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.+)$',
+        MediaView.as_view(),
+        name='media'
+    ),
+]
@@ -0,0 +1,60 @@
+import functools
+
+from asgiref.sync import sync_to_async
+
+from django.db import close_old_connections
+from django.urls import URLPattern
+
+
+# methods served concurrently by async_read_view
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _run_view(view, request, *args, **kwargs):
+    """Run a sync view and render its response in a pool thread"""
+    # request_started and request_finished close the connections of
+    # the thread Django runs sync code in, a pool thread closes its
+    # own so a connection never outlives CONN_MAX_AGE or an error
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_read_view(view):
+    """Return an async view running the safe methods of view in threads"""
+    # Django 3.1 runs every sync view of an ASGI server in one shared
+    # thread so one slow query holds up all other requests. The ORM
+    # and DRF are sync only, the reads here run in the thread pool of
+    # the event loop side by side, writes keep the shared thread
+    read = sync_to_async(
+        functools.partial(_run_view, view), thread_sensitive=False
+    )
+    write = sync_to_async(view, thread_sensitive=True)
+
+    async def async_view(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return await read(request, *args, **kwargs)
+
+        return await write(request, *args, **kwargs)
+
+    # keeps csrf_exempt and the view class of DRF views
+    return functools.update_wrapper(async_view, view)
+
+
+def async_read_patterns(patterns):
+    """Return the URL patterns with their views made async_read_view"""
+    return [
+        URLPattern(
+            pattern.pattern,
+            async_read_view(pattern.callback),
+            pattern.default_args,
+            pattern.name
+        )
+        for pattern in patterns
+    ]
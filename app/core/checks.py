@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def check_replica_sticky_cache(app_configs, **kwargs):
+    """Check the clients that wrote are remembered by every worker"""
+    if not settings.DATABASE_REPLICAS:
+        return []
+
+    alias = settings.DATABASE_REPLICA_STICKY_CACHE
+    if settings.CACHES[alias]['BACKEND'].endswith('.LocMemCache'):
+        return [Error(
+            f'The {alias} cache of DATABASE_REPLICA_STICKY_CACHE is only '
+            f'seen by its own process',
+            hint='Use a cache shared by the workers, like '
+                 'API_RESPONSE_CACHE=db, so a client reads its own writes '
+                 'on every worker.',
+            id='core.E001',
+        )]
+
+    return []
@@ -0,0 +1,124 @@
+import time
+from contextlib import contextmanager
+
+from django.db.backends.postgresql import base
+
+from core.db.pool import connection_stats, get_pool, pools
+
+
+def is_usable(connection):
+    """Return whether a psycopg2 connection still answers"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except base.Database.Error:
+        return False
+
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL with health checked persistent and pooled connections"""
+    # besides Django's settings the database settings may have
+    # HEALTH_CHECKS: check a connection kept from an earlier request
+    #   with SELECT 1 before its first query in the next one
+    # POOL_SIZE: share up to this many connections between the
+    #   threads of the process, connections go back to the pool at
+    #   the end of every request and live for CONN_MAX_AGE seconds
+    # POOL_TIMEOUT: seconds to wait for a free pooled connection
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_pending = False
+        self.pool = None
+        self.pool_opened = None
+
+    @property
+    def health_checks(self):
+        return bool(self.settings_dict.get('HEALTH_CHECKS'))
+
+    def _get_pool(self):
+        if not self.settings_dict.get('POOL_SIZE'):
+            return None
+
+        return get_pool(
+            self.alias,
+            tuple(self.settings_dict.get(key) for key in (
+                'NAME', 'HOST', 'PORT', 'USER'
+            )),
+            self.settings_dict['POOL_SIZE'],
+            self.settings_dict.get('POOL_TIMEOUT', 10),
+            self.settings_dict['CONN_MAX_AGE'] or None
+        )
+
+    def _open(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        connection_stats[self.alias]['opened'] += 1
+
+        return connection
+
+    def get_new_connection(self, conn_params):
+        self.pool = self._get_pool()
+        if self.pool is None:
+            return self._open(conn_params)
+
+        while True:
+            connection, self.pool_opened = self.pool.acquire()
+            if connection is None:
+                try:
+                    connection = self._open(conn_params)
+                except Exception:
+                    self.pool.discard(None)
+                    raise
+                self.pool_opened = time.monotonic()
+                return connection
+
+            if not self.health_checks or is_usable(connection):
+                return connection
+            connection_stats[self.alias]['health_check_failures'] += 1
+            self.pool.discard(connection)
+
+    def _close(self):
+        if self.connection is None:
+            return
+        if self.pool is None:
+            connection_stats[self.alias]['closed'] += 1
+            return super()._close()
+
+        pool, self.pool = self.pool, None
+        if self.errors_occurred:
+            # Django only closes a connection with errors when it
+            # isn't usable anymore
+            pool.discard(self.connection)
+        else:
+            pool.release(self.connection, self.pool_opened)
+
+    def close_if_unusable_or_obsolete(self):
+        # runs when a request starts and finishes
+        super().close_if_unusable_or_obsolete()
+        if self.connection is None or self.in_atomic_block:
+            return
+
+        if self.pool is not None:
+            # back to the pool for the other threads
+            self.close()
+        else:
+            self.health_check_pending = self.health_checks
+
+    def ensure_connection(self):
+        if (self.health_check_pending and self.connection is not None and
+                not self.in_atomic_block):
+            self.health_check_pending = False
+            if not self.is_usable():
+                connection_stats[self.alias]['health_check_failures'] += 1
+                self.close()
+        super().ensure_connection()
+
+    @contextmanager
+    def _nodb_cursor(self):
+        # used to create and drop the database, which fails while idle
+        # pooled connections to it are open
+        if self.alias in pools:
+            pools[self.alias].close_idle()
+        with super()._nodb_cursor() as cursor:
+            yield cursor
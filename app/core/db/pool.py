@@ -0,0 +1,188 @@
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+
+# connections opened and closed and failed health checks per database
+# alias, with or without a pool
+connection_stats = defaultdict(Counter)
+
+
+class PoolTimeout(OperationalError):
+    """No connection of the pool was free within the timeout"""
+
+
+class ConnectionPool:
+    """Connections to a database shared by the threads of a process"""
+
+    def __init__(self, alias, params, size, timeout, max_age=None):
+        self.alias = alias
+        self.params = params
+        self.size = size
+        self.timeout = timeout
+        self.max_age = max_age
+        # idle (connection, opened at) pairs, the most recently used
+        # connection is reused first so the others can age out
+        self._idle = deque()
+        self._open = 0
+        self._condition = threading.Condition()
+        self.stats = Counter()
+
+    def _close(self, connection):
+        connection_stats[self.alias]['closed'] += 1
+        connection.close()
+
+    def _expired(self, opened):
+        return (
+            self.max_age is not None and
+            time.monotonic() - opened >= self.max_age
+        )
+
+    def acquire(self):
+        """Return an idle (connection, opened at) pair or (None, None)"""
+        # (None, None) means the caller may open a new connection and
+        # has to pass it to release or discard
+        start = time.monotonic()
+        expired = []
+        try:
+            with self._condition:
+                while True:
+                    while self._idle:
+                        connection, opened = self._idle.pop()
+                        if self._expired(opened):
+                            self._open -= 1
+                            expired.append(connection)
+                            continue
+                        self._checked_out(start)
+                        return connection, opened
+                    if self._open < self.size:
+                        self._open += 1
+                        self._checked_out(start)
+                        return None, None
+
+                    remaining = self.timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        self.stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f'No database connection free after '
+                            f'{self.timeout} seconds'
+                        )
+                    self.stats['waits'] += 1
+                    self._condition.wait(remaining)
+        finally:
+            for connection in expired:
+                self.stats['expired'] += 1
+                self._close(connection)
+
+    def _checked_out(self, start):
+        waited = time.monotonic() - start
+        self.stats['checkouts'] += 1
+        self.stats['wait_seconds'] += waited
+        self.stats['max_wait_seconds'] = max(
+            self.stats['max_wait_seconds'], waited
+        )
+
+    def release(self, connection, opened):
+        """Return a connection to the pool for other threads"""
+        if (connection.closed or self._expired(opened) or
+                connection.get_transaction_status() !=
+                TRANSACTION_STATUS_IDLE):
+            # a connection in a transaction or in an unknown state is
+            # never handed to another thread
+            self.discard(connection)
+            return
+
+        with self._condition:
+            self._idle.append((connection, opened))
+            self._condition.notify()
+
+    def discard(self, connection):
+        """Close a connection of the pool and free its place"""
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+        if connection is not None and not connection.closed:
+            self._close(connection)
+
+    def close_idle(self):
+        """Close the idle connections"""
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._condition.notify_all()
+        for connection, _ in idle:
+            self._close(connection)
+
+    def metrics(self):
+        """Return the utilization and wait times of the pool"""
+        with self._condition:
+            stats = dict(self.stats)
+            in_use = self._open - len(self._idle)
+            idle = len(self._idle)
+        checkouts = stats.get('checkouts', 0)
+
+        return {
+            'size': self.size,
+            'in_use': in_use,
+            'idle': idle,
+            'utilization': in_use / self.size,
+            'checkouts': checkouts,
+            'waits': stats.get('waits', 0),
+            'timeouts': stats.get('timeouts', 0),
+            'expired': stats.get('expired', 0),
+            'wait_ms_avg': (
+                stats.get('wait_seconds', 0) / checkouts * 1000
+                if checkouts else 0
+            ),
+            'wait_ms_max': stats.get('max_wait_seconds', 0) * 1000,
+        }
+
+
+# pools by database alias, created by the backend on first use
+pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, params, size, timeout, max_age):
+    """Return the pool of the database alias, creating it if needed"""
+    # params identify the database, the tests switch the alias to the
+    # test database and connections to the old one must not be reused
+    with _pools_lock:
+        pool = pools.get(alias)
+        if pool is None or pool.params != params:
+            if pool is not None:
+                pool.close_idle()
+            pool = pools[alias] = ConnectionPool(
+                alias, params, size, timeout, max_age
+            )
+
+        return pool
+
+
+def close_inherited():
+    """Close the pooled connections of the parent of a forked process"""
+    # releasing them would hand the sockets the parent and the other
+    # children also have to the threads of this process
+    with _pools_lock:
+        inherited = list(pools.values())
+        pools.clear()
+    for pool in inherited:
+        for connection, _ in pool._idle:
+            connection.close()
+
+
+def get_metrics():
+    """Return the connection and pool metrics of every database"""
+    return {
+        alias: {
+            'connections_opened': stats['opened'],
+            'connections_closed': stats['closed'],
+            'health_check_failures': stats['health_check_failures'],
+            'pool': pools[alias].metrics() if alias in pools else None,
+        }
+        for alias, stats in sorted(connection_stats.items())
+    }
@@ -0,0 +1,234 @@
+import contextvars
+import hashlib
+import itertools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+logger = logging.getLogger(__name__)
+
+# methods whose requests read from the replicas
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# app label of the tables of django.core.cache.backends.db, the caches
+# hold versions that must not be read behind and writing to them
+# doesn't change what the client reads
+CACHE_APP_LABEL = 'django_cache'
+
+# lag of a standby in seconds, 0 once it replayed everything it received
+# and on a server that isn't a standby
+REPLICA_LAG_SQL = (
+    'SELECT COALESCE(CASE '
+    'WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) '
+    'END, 0)'
+)
+# whether a standby replayed the WAL up to a position of the primary,
+# always true on a server that isn't a standby
+REPLAYED_SQL = 'SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, true)'
+# seconds between two checks of whether the replicas replayed a write
+REPLAY_POLL_INTERVAL = 0.1
+
+# routing of the current request, None outside of requests
+_request = contextvars.ContextVar('replica_request', default=None)
+
+# alias -> (checked again after, healthy) for the replicas of the process
+_health = {}
+_health_lock = threading.Lock()
+_next_replica = itertools.count()
+
+
+class RequestRouting:
+    """Where the reads of a request go"""
+
+    def __init__(self, use_replicas):
+        self.use_replicas = use_replicas
+        # set on the first write, the request reads from the primary
+        # from then on and its client sticks to it for a while
+        self.wrote = False
+        # the replica chosen on the first read so every read of the
+        # request sees the same data, False when none was healthy
+        self.replica = None
+
+
+def replica_lag(alias):
+    """Return the replication lag of a database or None if it is down"""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(REPLICA_LAG_SQL)
+            return float(cursor.fetchone()[0])
+    except DatabaseError:
+        connection.close()
+        return None
+
+
+def replayed(alias, lsn):
+    """Return whether a database replayed the WAL up to a position"""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(REPLAYED_SQL, [lsn])
+            return cursor.fetchone()[0]
+    except DatabaseError:
+        # a replica that is down isn't read from
+        connection.close()
+        return True
+
+
+def _call_when_replayed(lsn, func):
+    # a replica further behind stops being read from once it is
+    # checked again, waiting longer doesn't change what clients read
+    deadline = time.monotonic() + (
+        settings.DATABASE_REPLICA_MAX_LAG +
+        settings.DATABASE_REPLICA_CHECK_INTERVAL
+    )
+    pending = list(settings.DATABASE_REPLICAS)
+    try:
+        while pending and time.monotonic() < deadline:
+            pending = [alias for alias in pending if not replayed(alias, lsn)]
+            if pending:
+                time.sleep(REPLAY_POLL_INTERVAL)
+        func()
+    except Exception:
+        logger.exception('Calling %r after replication failed', func)
+    finally:
+        connections.close_all()
+
+
+def on_replicated(func):
+    """Call func once the replicas replayed the writes committed so far"""
+    if not settings.DATABASE_REPLICAS:
+        func()
+        return
+
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute('SELECT pg_current_wal_lsn()')
+        lsn = cursor.fetchone()[0]
+    threading.Thread(
+        target=_call_when_replayed, args=(lsn, func), daemon=True
+    ).start()
+
+
+def is_healthy(alias):
+    """Return whether a replica answers and isn't too far behind"""
+    now = time.monotonic()
+    with _health_lock:
+        checked = _health.get(alias)
+    if checked is not None and now < checked[0]:
+        return checked[1]
+
+    lag = replica_lag(alias)
+    healthy = lag is not None and lag <= settings.DATABASE_REPLICA_MAX_LAG
+    with _health_lock:
+        _health[alias] = (
+            now + settings.DATABASE_REPLICA_CHECK_INTERVAL, healthy
+        )
+
+    return healthy
+
+
+def choose_replica():
+    """Return the next healthy replica in turn or None"""
+    replicas = settings.DATABASE_REPLICAS
+    start = next(_next_replica)
+    for offset in range(len(replicas)):
+        alias = replicas[(start + offset) % len(replicas)]
+        if is_healthy(alias):
+            return alias
+
+    return None
+
+
+def _sticky_key(request):
+    # the credentials identify the client before the view
+    # authenticates it, which may already read from a replica
+    credentials = request.META.get('HTTP_AUTHORIZATION') or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    digest = hashlib.sha256(credentials.encode()).hexdigest()
+
+    return f'replica-sticky:{digest}'
+
+
+class ReplicaMiddleware:
+    """Let the reads of safe requests go to the replicas"""
+    # a client that wrote is kept on the primary for
+    # DATABASE_REPLICA_STICKY_SECONDS so it reads its own writes,
+    # remembered in the cache shared by the workers
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        cache = caches[settings.DATABASE_REPLICA_STICKY_CACHE]
+        key = _sticky_key(request)
+        use_replicas = request.method in SAFE_METHODS and not (
+            key is not None and cache.get(key)
+        )
+        routing = RequestRouting(use_replicas)
+        token = _request.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+            if routing.wrote and key is not None:
+                cache.set(
+                    key, True, settings.DATABASE_REPLICA_STICKY_SECONDS
+                )
+
+        return response
+
+
+class ReplicaRouter:
+    """Send the reads of safe requests to the replicas"""
+    # writes and select_for_update always go to the primary, so do the
+    # database caches and the reads of other requests, of a request
+    # after its first write and of code running outside of requests
+    # like management commands
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return DEFAULT_DB_ALIAS
+
+        routing = _request.get()
+        if routing is None or not routing.use_replicas or routing.wrote:
+            return None
+
+        if routing.replica is None:
+            routing.replica = choose_replica() or False
+
+        return routing.replica or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        routing = _request.get()
+        if (routing is not None and
+                model._meta.app_label != CACHE_APP_LABEL):
+            routing.wrote = True
+
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas are copies of the primary
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replicas get the tables from the primary
+        if db in settings.DATABASE_REPLICAS:
+            return False
+
+        return None
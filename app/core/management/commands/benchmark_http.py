@@ -0,0 +1,214 @@
+import asyncio
+import math
+import shlex
+import signal
+import statistics
+import subprocess
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework.authtoken.models import Token
+
+
+class Client:
+    """An HTTP/1.1 client sending requests over one kept alive connection"""
+
+    def __init__(self, host, port, request):
+        self.host = host
+        self.port = port
+        self.request = request
+        self.reader = self.writer = None
+
+    async def _read_body(self, headers):
+        if headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    return
+        await self.reader.readexactly(int(headers.get('content-length', 0)))
+
+    async def get(self):
+        """Send the request and return the response status"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        self.writer.write(self.request)
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        await self._read_body(headers)
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    """Django command to load test a running server over HTTP"""
+    help = (
+        'Send GET requests to a running server from many concurrent '
+        'clients that keep their connections open and print the '
+        'throughput and latency. Run it against the WSGI and the ASGI '
+        'server with the same URL and clients to compare them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'url',
+            nargs='?',
+            default='http://127.0.0.1:8000/api/recipe/recipes/'
+        )
+        parser.add_argument('--email', default='bench0@example.com')
+        parser.add_argument('--clients', type=int, default=500)
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=30,
+            help='Seconds to send requests for after the warm up'
+        )
+        parser.add_argument('--warmup', type=float, default=5)
+        parser.add_argument(
+            '--start',
+            metavar='COMMAND',
+            help='Start the server with COMMAND, time how long it takes '
+                 'to answer and to stop on SIGTERM after the run'
+        )
+
+    def _request(self, url, email):
+        user = get_user_model().objects.filter(email=email).first()
+        if user is None:
+            raise CommandError(f'No user {email}, run seed_recipes first')
+        token, _ = Token.objects.get_or_create(user=user)
+        path = url.path + (f'?{url.query}' if url.query else '')
+
+        return (
+            f'GET {path} HTTP/1.1\r\n'
+            f'Host: {url.netloc}\r\n'
+            f'Authorization: Token {token.key}\r\n'
+            f'Accept: application/json\r\n'
+            f'\r\n'
+        ).encode()
+
+    async def _run_client(self, client, start, end, timings, errors):
+        while time.perf_counter() < end:
+            sent = time.perf_counter()
+            try:
+                status = await client.get()
+            except (OSError, ValueError, IndexError,
+                    asyncio.IncompleteReadError) as exc:
+                client.close()
+                errors[type(exc).__name__] = (
+                    errors.get(type(exc).__name__, 0) + 1
+                )
+                await asyncio.sleep(0.01)
+                continue
+            if sent < start:
+                continue
+            timings.append((time.perf_counter() - sent) * 1000)
+            if status != 200:
+                errors[status] = errors.get(status, 0) + 1
+        client.close()
+
+    async def _run(self, url, request, options):
+        timings = []
+        errors = {}
+        start = time.perf_counter() + options['warmup']
+        end = start + options['duration']
+        await asyncio.gather(*(
+            self._run_client(
+                Client(url.hostname, url.port or 80, request),
+                start, end, timings, errors
+            )
+            for _ in range(options['clients'])
+        ))
+
+        return timings, errors
+
+    async def _wait_for_server(self, url, request, process, timeout=60):
+        """Return once the server answers a request"""
+        client = Client(url.hostname, url.port or 80, request)
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise CommandError('The server exited while starting')
+            try:
+                await client.get()
+                client.close()
+                return
+            except (OSError, ValueError, IndexError,
+                    asyncio.IncompleteReadError):
+                client.close()
+                await asyncio.sleep(0.01)
+
+        raise CommandError(f'The server did not answer in {timeout}s')
+
+    def _start(self, url, request, command):
+        """Start the server and return its process once it answers"""
+        start = time.perf_counter()
+        process = subprocess.Popen(shlex.split(command))
+        try:
+            asyncio.run(self._wait_for_server(url, request, process))
+        except BaseException:
+            process.kill()
+            raise
+        self.stdout.write(self.style.SUCCESS(
+            f'Started in {time.perf_counter() - start:.2f} s'
+        ))
+
+        return process
+
+    def _stop(self, process):
+        """Stop the server gracefully and print how long it took"""
+        start = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            raise CommandError('The server did not stop in 60s')
+        self.stdout.write(self.style.SUCCESS(
+            f'Stopped in {time.perf_counter() - start:.2f} s'
+        ))
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        request = self._request(url, options['email'])
+
+        process = None
+        if options['start']:
+            process = self._start(url, request, options['start'])
+        try:
+            timings, errors = asyncio.run(self._run(url, request, options))
+        finally:
+            if process is not None:
+                self._stop(process)
+        if not timings:
+            raise CommandError(f'No responses, errors: {errors}')
+
+        timings.sort()
+        p95 = timings[math.ceil(len(timings) * 0.95) - 1]
+        p99 = timings[math.ceil(len(timings) * 0.99) - 1]
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["clients"]} clients: '
+            f'{len(timings) / options["duration"]:.1f} requests/s, '
+            f'median {statistics.median(timings):.1f} ms, '
+            f'p95 {p95:.1f} ms, p99 {p99:.1f} ms '
+            f'over {len(timings)} requests'
+        ))
+        if errors:
+            self.stdout.write(self.style.WARNING(f'Errors: {errors}'))
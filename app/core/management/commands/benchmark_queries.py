@@ -0,0 +1,141 @@
+import math
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F
+
+from core.models import Tag, Ingredient, Recipe
+
+
+PAGE_SIZE = 100
+
+
+class Command(BaseCommand):
+    """Django command to time and explain the hot API queries"""
+    help = (
+        'Run the queries behind the recipe API list and filter endpoints '
+        'for a seeded user (see seed_recipes) and print their timings '
+        'and EXPLAIN ANALYZE plans. To compare an index change run it '
+        'once before and once after the migration.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', default='bench0@example.com')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            help='Only run the given scenario, may be repeated'
+        )
+        parser.add_argument(
+            '--no-explain',
+            action='store_true',
+            help='Only print timings'
+        )
+
+    def get_scenarios(self, user):
+        """Return the querysets to benchmark by name"""
+        tag_ids = list(
+            Tag.objects.filter(user=user).values_list('id', flat=True)[:20]
+        )
+        ingredient_ids = list(
+            Ingredient.objects.filter(
+                user=user
+            ).values_list('id', flat=True)[:20]
+        )
+        recipes = Recipe.objects.filter(user=user)
+
+        # the recipe filters with 1, 5 and 20 ids in both match modes
+        filters = {
+            f'recipes_by_{field}_{match}_{count}': recipes.related_to(
+                field, ids[:count], match_all=match == 'all'
+            ).order_by('-id')[:PAGE_SIZE]
+            for field, ids in (
+                ('tags', tag_ids), ('ingredients', ingredient_ids)
+            )
+            for match in ('any', 'all')
+            for count in (1, 5, 20)
+        }
+
+        return {
+            'tags_list': Tag.objects.filter(
+                user=user
+            ).order_by('-name', 'id')[:PAGE_SIZE],
+            'tags_assigned_only': Tag.objects.filter(
+                user=user, recipe_count__gt=0
+            ).order_by('-name', 'id')[:PAGE_SIZE],
+            'tags_popular': Tag.objects.filter(
+                user=user
+            ).order_by('-recipe_count', 'id')[:PAGE_SIZE],
+            'ingredients_list': Ingredient.objects.filter(
+                user=user
+            ).order_by('-name', 'id')[:PAGE_SIZE],
+            'recipes_list': recipes.order_by('-id')[:PAGE_SIZE],
+            **filters,
+            # a word in a fifth of the seeded titles and a narrow query
+            'recipes_search': recipes.search('chicken')[:PAGE_SIZE],
+            'recipes_search_phrase': recipes.search(
+                'salmon lime -soup'
+            )[:PAGE_SIZE],
+            # the facet counts of every recipe and of a search
+            'ingredient_facets': Ingredient.objects.filter(
+                user=user, recipe_count__gt=0
+            ).values(
+                'id', 'name', count=F('recipe_count')
+            ).order_by('-count', 'name'),
+            'ingredient_facets_search': Ingredient.objects.filter(
+                user=user,
+                recipe__in=recipes.search('chicken').order_by().values('pk')
+            ).values('id', 'name').annotate(
+                count=Count('recipe')
+            ).order_by('-count', 'name'),
+            # a typed prefix and a misspelling
+            'tags_autocomplete_prefix': Tag.objects.filter(
+                user=user
+            ).autocomplete('chi')[:10],
+            'tags_autocomplete_fuzzy': Tag.objects.filter(
+                user=user
+            ).autocomplete('chiken')[:10],
+        }
+
+    def _time(self, queryset, repeat):
+        """Return the run times of the queryset in milliseconds"""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            # all() returns a fresh copy so results are never cached
+            list(queryset.all())
+            timings.append((time.perf_counter() - start) * 1000)
+
+        return timings
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(email=options['email']).first()
+        if user is None:
+            raise CommandError(
+                f'No user {options["email"]}, run seed_recipes first'
+            )
+
+        scenarios = self.get_scenarios(user)
+        names = options['scenario'] or list(scenarios)
+        unknown = set(names) - set(scenarios)
+        if unknown:
+            raise CommandError(f'Unknown scenario {", ".join(unknown)}')
+
+        for name in names:
+            queryset = scenarios[name]
+            timings = sorted(self._time(queryset, options['repeat']))
+            p95 = timings[math.ceil(len(timings) * 0.95) - 1]
+            p99 = timings[math.ceil(len(timings) * 0.99) - 1]
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: median {statistics.median(timings):.2f} ms, '
+                f'p95 {p95:.2f} ms, p99 {p99:.2f} ms '
+                f'over {len(timings)} runs'
+            ))
+            if not options['no_explain']:
+                self.stdout.write(
+                    queryset.explain(analyze=True, buffers=True)
+                )
+                self.stdout.write('')
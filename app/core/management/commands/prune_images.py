@@ -0,0 +1,189 @@
+import glob
+import itertools
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+
+
+# uploaded images, legacy names are upload/recipe/<uuid>.<ext> and
+# content addressed names upload/recipe/<xx>/<yy>/<digest>.<ext>
+IMAGE_DIRECTORY = 'upload/recipe'
+# the resized copies of an image are in a directory named after its
+# stem in each of these, see recipe.images
+COPY_DIRECTORIES = ('derivative/recipe', 'resized/recipe')
+
+
+def batched(iterable, size):
+    """Yield lists of at most size items of the iterable"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def walk_files(root):
+    """Yield the os.DirEntry of every file below root"""
+    # scandir reads a directory at a time so a large tree is never
+    # listed in memory at once
+    try:
+        entries = os.scandir(root)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_files(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+class Command(BaseCommand):
+    """Django command to remove recipe images no recipe refers to"""
+    help = (
+        'Remove the uploaded recipe images that no recipe refers to, '
+        'their resized copies and staged uploads left behind. Files '
+        'changed within the grace period are kept since an upload is '
+        'stored before its recipe is saved.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list what would be removed'
+        )
+        parser.add_argument(
+            '--quarantine',
+            metavar='DIRECTORY',
+            help='Move the files below DIRECTORY instead of deleting them'
+        )
+        parser.add_argument(
+            '--grace',
+            type=float,
+            default=24,
+            help='Keep files changed within this many hours'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.cutoff = time.time() - options['grace'] * 60 * 60
+        self.removed = 0
+        self.freed = 0
+
+        for batch in batched(self.old_files(IMAGE_DIRECTORY),
+                             options['batch_size']):
+            referenced = set(Recipe.objects.filter(
+                image__in=batch
+            ).values_list('image', flat=True))
+            for name in batch:
+                if name not in referenced:
+                    self.remove(name)
+
+        for directory in COPY_DIRECTORIES:
+            for batch in batched(self.copy_stems(directory),
+                                 options['batch_size']):
+                referenced = self.referenced_stems(batch)
+                for stem in batch:
+                    if stem not in referenced:
+                        self.remove(f'{directory}/{stem}')
+
+        # uploads staged by a worker that died before storing them
+        upload_dir = os.path.relpath(
+            settings.RECIPE_IMAGE_UPLOAD_DIR, settings.MEDIA_ROOT
+        )
+        for name in self.old_files(upload_dir):
+            self.remove(name)
+
+        verb = 'Would remove' if options['dry_run'] else (
+            'Quarantined' if options['quarantine'] else 'Removed'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {self.removed} orphaned files and directories '
+            f'({self.freed / 2 ** 20:.1f} MiB)'
+        ))
+
+    def path(self, name):
+        return os.path.join(settings.MEDIA_ROOT, name)
+
+    def old_files(self, directory):
+        """Yield the names of the files in directory past the grace"""
+        root = self.path(directory)
+        for entry in walk_files(root):
+            if entry.stat().st_mtime < self.cutoff:
+                name = os.path.relpath(entry.path, settings.MEDIA_ROOT)
+                yield name.replace(os.sep, '/')
+
+    def copy_stems(self, directory):
+        """Yield the image stems with copies in directory"""
+        try:
+            entries = os.scandir(self.path(directory))
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                if entry.is_dir() and entry.stat().st_mtime < self.cutoff:
+                    yield entry.name
+
+    def referenced_stems(self, stems):
+        """Return the stems of stems that are the name of a used image"""
+        # the extension isn't part of the stem, the candidate names
+        # are read from the image directories before asking the
+        # database about them
+        names = {}
+        for stem in stems:
+            pattern = f'{glob.escape(stem)}.*'
+            patterns = (
+                f'{IMAGE_DIRECTORY}/{stem[:2]}/{stem[2:4]}/{pattern}',
+                f'{IMAGE_DIRECTORY}/{pattern}',
+            )
+            for pattern in patterns:
+                for path in glob.glob(self.path(pattern)):
+                    name = os.path.relpath(path, settings.MEDIA_ROOT)
+                    names[name.replace(os.sep, '/')] = stem
+
+        return {
+            names[name] for name in Recipe.objects.filter(
+                image__in=names
+            ).values_list('image', flat=True)
+        }
+
+    def remove(self, name):
+        """Delete or quarantine the file or directory with the name"""
+        path = self.path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        if stat.st_mtime >= self.cutoff:
+            # used again since it was listed, storing an image that
+            # already exists refreshes its modification time
+            return
+
+        if os.path.isdir(path):
+            size = sum(entry.stat().st_size for entry in walk_files(path))
+        else:
+            size = stat.st_size
+        self.removed += 1
+        self.freed += size
+
+        if self.options['verbosity'] >= 2 or self.options['dry_run']:
+            self.stdout.write(name)
+        if self.options['dry_run']:
+            return
+
+        if self.options['quarantine']:
+            target = os.path.join(self.options['quarantine'], name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(path, target)
+        elif os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
@@ -0,0 +1,149 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.models import Tag, Ingredient, Recipe
+
+
+# words used to build recipe titles and tag and ingredient names
+# so searches and filters see a realistic spread of values
+WORDS = (
+    'chicken', 'beef', 'pork', 'tofu', 'salmon', 'prawn', 'lentil',
+    'bean', 'rice', 'noodle', 'pasta', 'potato', 'tomato', 'onion',
+    'garlic', 'ginger', 'chilli', 'lemon', 'lime', 'coconut', 'curry',
+    'soup', 'salad', 'stew', 'roast', 'grilled', 'baked', 'fried',
+    'spicy', 'sweet', 'sour', 'creamy', 'smoky', 'crispy', 'quick',
+    'easy', 'vegan', 'dessert', 'breakfast', 'lunch', 'dinner', 'snack',
+)
+
+
+class Command(BaseCommand):
+    """Django command to seed a large dataset for benchmarking"""
+    help = (
+        'Seed users with generated tags, ingredients and recipes. '
+        'Rows are generated inside PostgreSQL with generate_series '
+        'so millions of recipes can be created in a few minutes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=5)
+        parser.add_argument(
+            '--email',
+            default='bench{}@example.com',
+            help='Email pattern of the seeded users, {} is the user number'
+        )
+
+    def _users(self, options):
+        """Return the IDs of the seeded users, creating them if needed"""
+        ids = []
+        for number in range(options['users']):
+            email = options['email'].format(number)
+            user = get_user_model().objects.filter(email=email).first()
+            if user is None:
+                user = get_user_model().objects.create_user(email, 'bench')
+            ids.append(user.id)
+
+        return ids
+
+    def _seed_attrs(self, cursor, model, user_ids, count):
+        """Create count named objects of model for every user"""
+        cursor.execute(
+            f'INSERT INTO {model._meta.db_table} '
+            '(user_id, name, recipe_count) '
+            'SELECT u, w.words[1 + g %% %s] || \' \' || g, 0 '
+            'FROM unnest(%s::int[]) AS u, generate_series(1, %s) AS g, '
+            '(SELECT %s::text[] AS words) AS w',
+            [len(WORDS), user_ids, count, list(WORDS)]
+        )
+
+    def _seed_recipes(self, cursor, user_ids, count):
+        """Create count recipes spread evenly over the users"""
+        # the first user gets every recipe with g % users = 0
+        # so the newest and oldest recipes are interleaved
+        cursor.execute(
+            f'INSERT INTO {Recipe._meta.db_table} '
+            '(user_id, title, time_minutes, price, link, image_sizes) '
+            'SELECT u.ids[1 + g %% %s], '
+            'w.words[1 + g %% %s] || \' \' || w.words[1 + g / 7 %% %s] '
+            '|| \' \' || w.words[1 + g / 49 %% %s], '
+            '5 + g %% 120, (g %% 9999) / 100.0, \'\', \'{}\' '
+            'FROM generate_series(1, %s) AS g, '
+            '(SELECT %s::int[] AS ids) AS u, '
+            '(SELECT %s::text[] AS words) AS w',
+            [
+                len(user_ids), len(WORDS), len(WORDS), len(WORDS),
+                count, user_ids, list(WORDS),
+            ]
+        )
+
+    def _seed_relation(self, cursor, field, per_recipe, recipe_min_id):
+        """Link every new recipe to per_recipe of its user's objects"""
+        through = field.remote_field.through._meta.db_table
+        target = field.related_model._meta.db_table
+        column = field.m2m_reverse_name()
+        # pick per_recipe distinct objects out of the user's objects
+        # with a stride so the popularity of objects is uneven, the
+        # triggers of migration 0013 count the inserted relations
+        cursor.execute(
+            'WITH attrs AS ('
+            '  SELECT user_id, array_agg(id ORDER BY id) AS ids '
+            f'  FROM {target} GROUP BY user_id'
+            ') '
+            f'INSERT INTO {through} (recipe_id, {column}) '
+            'SELECT r.id, '
+            'a.ids[1 + (r.id * 7 + k * 13) %% cardinality(a.ids)] '
+            f'FROM {Recipe._meta.db_table} r '
+            'JOIN attrs a ON a.user_id = r.user_id, '
+            'generate_series(0, %s) AS k '
+            'WHERE r.id >= %s '
+            'ON CONFLICT DO NOTHING',
+            [per_recipe - 1, recipe_min_id]
+        )
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        user_ids = self._users(options)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT COALESCE(MAX(id), 0) + 1 '
+                f'FROM {Recipe._meta.db_table}'
+            )
+            recipe_min_id = cursor.fetchone()[0]
+
+            self.stdout.write('Seeding tags and ingredients...')
+            self._seed_attrs(cursor, Tag, user_ids, options['tags'])
+            self._seed_attrs(
+                cursor, Ingredient, user_ids, options['ingredients']
+            )
+            self.stdout.write(f'Seeding {options["recipes"]} recipes...')
+            self._seed_recipes(cursor, user_ids, options['recipes'])
+            self.stdout.write('Linking tags and ingredients...')
+            self._seed_relation(
+                cursor,
+                Recipe._meta.get_field('tags'),
+                options['tags_per_recipe'],
+                recipe_min_id
+            )
+            self._seed_relation(
+                cursor,
+                Recipe._meta.get_field('ingredients'),
+                options['ingredients_per_recipe'],
+                recipe_min_id
+            )
+
+        # refresh the planner statistics for the new rows
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(user_ids)} users in '
+            f'{time.monotonic() - start:.1f}s'
+        ))
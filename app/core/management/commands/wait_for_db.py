@@ -1,8 +1,10 @@
+import random
 import time
 
 # import the conntctions module which is
 # what we can use ti test if the database connection is available
 from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
 
 # import the operational errorr that Django
 # will throw if the database isn't available
@@ -10,26 +12,96 @@ from django.db.utils import OperationalError
 
 # import base command the class that we need to build on
 # in order to create our custom command
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
     """Django command to pause execution until database is available"""
+    help = (
+        'Wait until the database answers a query, retrying with a '
+        'jittered exponential backoff, and optionally until every '
+        'migration is applied. Exits with an error after the timeout.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=60,
+            help='Seconds to wait before giving up'
+        )
+        parser.add_argument(
+            '--initial-delay',
+            type=float,
+            default=0.05,
+            help='Seconds to wait after the first failure, doubled after '
+                 'every further one'
+        )
+        parser.add_argument(
+            '--max-delay',
+            type=float,
+            default=2,
+            help='Longest wait between two attempts in seconds'
+        )
+        parser.add_argument(
+            '--migrations',
+            action='store_true',
+            help='Also wait until every migration is applied'
+        )
+
+    def check_database(self, connection):
+        """Raise OperationalError unless the database answers a query"""
+        # getting the connection doesn't open it, a query does
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    def unapplied_migrations(self, connection):
+        """Return how many migrations aren't applied yet"""
+        executor = MigrationExecutor(connection)
+        targets = executor.loader.graph.leaf_nodes()
+
+        return len(executor.migration_plan(targets))
 
     def handle(self, *args, **options):
         # passing *args, **options to management commends
         # output a message to the screen
         self.stdout.write("Waiting for database...")
-        db_conn = None
+        deadline = time.monotonic() + options['timeout']
+        attempt = 0
 
-        # while db_conn is false value it could be a blank string or None
-        while not db_conn:
+        while True:
+            connection = connections[options['database']]
             try:
-                # try set db.conn to the database connection
-                db_conn = connections["default"]
-            except OperationalError:
-                self.stdout.write("Database unavailable, waiting 1 second...")
-                time.sleep(1)
+                self.check_database(connection)
+                if not options['migrations']:
+                    break
+                unapplied = self.unapplied_migrations(connection)
+                if not unapplied:
+                    break
+                reason = f'{unapplied} migrations not applied'
+            except OperationalError as exc:
+                # the next attempt opens a new connection
+                connection.close()
+                reason = f'Database unavailable ({" ".join(str(exc).split())})'
+
+            # the delay doubles with every attempt up to max_delay,
+            # half of it is random so restarted containers don't all
+            # retry at the same moment
+            delay = min(
+                options['max_delay'],
+                options['initial_delay'] * 2 ** attempt
+            )
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise CommandError(
+                    f'{reason}, gave up after {options["timeout"]} seconds'
+                )
+            delay = min(delay, remaining)
+            self.stdout.write(f'{reason}, waiting {delay:.2f} seconds...')
+            time.sleep(delay)
+            attempt += 1
 
         # final message that says the database is available
         self.stdout.write(self.style.SUCCESS("Database available!!"))
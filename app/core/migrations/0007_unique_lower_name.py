@@ -0,0 +1,53 @@
+# Generated by Django 3.1.14 on 2026-10-17 07:30
+
+from django.db import migrations
+
+
+def unique_lower_name_sql(table, through, column):
+    """Return the SQL merging duplicate names and making them unique"""
+    return f'''
+        -- no new duplicates can be written until the index exists
+        LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE;
+        -- check the foreign keys now, an index can't be created on a
+        -- table with deferred checks still pending
+        SET CONSTRAINTS ALL IMMEDIATE;
+        CREATE TEMPORARY TABLE {table}_dupes ON COMMIT DROP AS
+            SELECT id, keep FROM (
+                SELECT id, min(id) OVER (
+                    PARTITION BY user_id, lower(name)
+                ) AS keep
+                FROM {table}
+            ) AS named WHERE id <> keep;
+        -- move the recipes of every duplicate to the oldest object
+        INSERT INTO {through} (recipe_id, {column})
+            SELECT r.recipe_id, d.keep
+            FROM {through} r JOIN {table}_dupes d ON d.id = r.{column}
+            ON CONFLICT DO NOTHING;
+        DELETE FROM {through}
+            WHERE {column} IN (SELECT id FROM {table}_dupes);
+        DELETE FROM {table} WHERE id IN (SELECT id FROM {table}_dupes);
+        CREATE UNIQUE INDEX {table}_user_lower_name_uniq
+            ON {table} (user_id, lower(name));
+    '''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_user_scoped_indexes'),
+    ]
+
+    # Django 3.1 can't declare a unique constraint on lower(name) in
+    # the model Meta so the index only exists in the database
+    operations = [
+        migrations.RunSQL(
+            unique_lower_name_sql('core_tag', 'core_recipe_tags', 'tag_id'),
+            'DROP INDEX core_tag_user_lower_name_uniq;',
+        ),
+        migrations.RunSQL(
+            unique_lower_name_sql(
+                'core_ingredient', 'core_recipe_ingredients', 'ingredient_id'
+            ),
+            'DROP INDEX core_ingredient_user_lower_name_uniq;',
+        ),
+    ]
@@ -0,0 +1,133 @@
+# Generated by Django 3.1.14 on 2026-10-17 07:50
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import BtreeGinExtension
+from django.db import migrations
+
+
+# the document of a recipe: the title weighted highest, then the
+# names of its tags and then the names of its ingredients
+CREATE_DOCUMENT_FUNCTION = '''
+CREATE FUNCTION core_recipe_document(recipe_id integer, title text)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('english', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(t.name, ' ')
+            FROM core_recipe_tags rt JOIN core_tag t ON t.id = rt.tag_id
+            WHERE rt.recipe_id = $1
+        ), '')), 'B')
+        || setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM core_recipe_ingredients ri
+            JOIN core_ingredient i ON i.id = ri.ingredient_id
+            WHERE ri.recipe_id = $1
+        ), '')), 'C');
+$$ LANGUAGE sql STABLE;
+
+-- every save() of a recipe writes the title so the vector is
+-- rebuilt, even though Django also writes its stale copy of it
+CREATE FUNCTION core_recipe_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := core_recipe_document(NEW.id, NEW.title);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_search_vector
+    BEFORE INSERT OR UPDATE OF title ON core_recipe
+    FOR EACH ROW EXECUTE PROCEDURE core_recipe_search_vector_trigger();
+
+-- statement level so a bulk insert of relations rebuilds each
+-- recipe once instead of once per row
+CREATE FUNCTION core_recipe_relations_trigger() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe r
+        SET search_vector = core_recipe_document(r.id, r.title)
+        WHERE r.id IN (SELECT recipe_id FROM changed);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+RELATION_TRIGGERS = '''
+CREATE TRIGGER {through}_search_insert
+    AFTER INSERT ON {through} REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_recipe_relations_trigger();
+CREATE TRIGGER {through}_search_delete
+    AFTER DELETE ON {through} REFERENCING OLD TABLE AS changed
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_recipe_relations_trigger();
+
+CREATE FUNCTION {table}_search_rename_trigger() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe r
+        SET search_vector = core_recipe_document(r.id, r.title)
+        WHERE r.id IN (
+            SELECT recipe_id FROM {through} WHERE {column} = NEW.id
+        );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER {table}_search_rename
+    AFTER UPDATE OF name ON {table}
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE PROCEDURE {table}_search_rename_trigger();
+'''
+
+DROP_RELATION_TRIGGERS = '''
+DROP TRIGGER {through}_search_insert ON {through};
+DROP TRIGGER {through}_search_delete ON {through};
+DROP TRIGGER {table}_search_rename ON {table};
+DROP FUNCTION {table}_search_rename_trigger();
+'''
+
+DROP_DOCUMENT_FUNCTION = '''
+DROP TRIGGER core_recipe_search_vector ON core_recipe;
+DROP FUNCTION core_recipe_relations_trigger();
+DROP FUNCTION core_recipe_search_vector_trigger();
+DROP FUNCTION core_recipe_document(integer, text);
+'''
+
+RELATIONS = (
+    {'table': 'core_tag', 'through': 'core_recipe_tags', 'column': 'tag_id'},
+    {
+        'table': 'core_ingredient',
+        'through': 'core_recipe_ingredients',
+        'column': 'ingredient_id',
+    },
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_unique_lower_name'),
+    ]
+
+    operations = [
+        BtreeGinExtension(),
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_DOCUMENT_FUNCTION, DROP_DOCUMENT_FUNCTION),
+    ] + [
+        migrations.RunSQL(
+            RELATION_TRIGGERS.format(**relation),
+            DROP_RELATION_TRIGGERS.format(**relation),
+        )
+        for relation in RELATIONS
+    ] + [
+        # fill in the existing recipes
+        migrations.RunSQL(
+            'UPDATE core_recipe '
+            'SET search_vector = core_recipe_document(id, title);',
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['user', 'search_vector'], name='core_recipe_search_idx'),
+        ),
+    ]
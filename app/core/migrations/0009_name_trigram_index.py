@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-17 08:20
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_search_vector'),
+    ]
+
+    # GinIndex in Django 3.1 can't index an expression, the index is
+    # on lower(name) so prefix LIKE queries can use it as well as the
+    # similarity operator, user_id is indexed through btree_gin
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(
+            'CREATE INDEX core_tag_name_trgm_idx ON core_tag '
+            'USING gin (user_id, lower(name) gin_trgm_ops);',
+            'DROP INDEX core_tag_name_trgm_idx;',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX core_ingredient_name_trgm_idx ON core_ingredient '
+            'USING gin (user_id, lower(name) gin_trgm_ops);',
+            'DROP INDEX core_ingredient_name_trgm_idx;',
+        ),
+    ]
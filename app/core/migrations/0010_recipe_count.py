@@ -0,0 +1,54 @@
+# Generated by Django 3.1.14 on 2026-10-17 09:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+def backfill_sql(table, through, column):
+    """Return the SQL counting the recipes of every tag or ingredient"""
+    return (
+        f'UPDATE {table} SET recipe_count = counts.recipe_count '
+        f'FROM (SELECT {column}, COUNT(*) AS recipe_count FROM {through} '
+        f'GROUP BY {column}) AS counts '
+        f'WHERE {table}.id = counts.{column};'
+    )
+
+
+class Migration(migrations.Migration):
+    # the indexes are built concurrently like in 0006
+    atomic = False
+
+    dependencies = [
+        ('core', '0009_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            backfill_sql('core_tag', 'core_recipe_tags', 'tag_id'),
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            backfill_sql(
+                'core_ingredient', 'core_recipe_ingredients', 'ingredient_id'
+            ),
+            migrations.RunSQL.noop,
+        ),
+        AddIndexConcurrently(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-recipe_count', 'id'], name='core_ingredient_user_count_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='tag',
+            index=models.Index(fields=['user', '-recipe_count', 'id'], name='core_tag_user_count_idx'),
+        ),
+    ]
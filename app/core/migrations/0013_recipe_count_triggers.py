@@ -0,0 +1,76 @@
+# Generated by Django 3.1.14 on 2026-10-17 11:40
+
+from django.db import migrations
+
+
+# the transition tables only hold the rows a statement really inserted
+# or deleted, rows skipped by ON CONFLICT DO NOTHING or deleted by a
+# concurrent transaction first aren't counted
+COUNT_TRIGGERS = '''
+CREATE FUNCTION {through}_count_trigger() RETURNS trigger AS $$
+DECLARE
+    change integer := CASE TG_OP WHEN 'INSERT' THEN 1 ELSE -1 END;
+BEGIN
+    -- lock the objects in the order of their ids so concurrent
+    -- statements changing the same objects can't deadlock
+    PERFORM 1 FROM {table}
+        WHERE id IN (SELECT {column} FROM changed)
+        ORDER BY id FOR UPDATE;
+    UPDATE {table} t
+        SET recipe_count = t.recipe_count + change * c.count
+        FROM (
+            SELECT {column} AS id, COUNT(*) AS count
+            FROM changed GROUP BY {column}
+        ) AS c
+        WHERE t.id = c.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER {through}_count_insert
+    AFTER INSERT ON {through} REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE PROCEDURE {through}_count_trigger();
+CREATE TRIGGER {through}_count_delete
+    AFTER DELETE ON {through} REFERENCING OLD TABLE AS changed
+    FOR EACH STATEMENT EXECUTE PROCEDURE {through}_count_trigger();
+
+-- recount in case concurrent changes left the counts of the signal
+-- receivers off
+LOCK TABLE {through} IN SHARE MODE;
+UPDATE {table} t SET recipe_count = COALESCE(c.count, 0)
+    FROM {table} o LEFT JOIN (
+        SELECT {column} AS id, COUNT(*) AS count
+        FROM {through} GROUP BY {column}
+    ) AS c ON c.id = o.id
+    WHERE t.id = o.id AND t.recipe_count <> COALESCE(c.count, 0);
+'''
+
+DROP_COUNT_TRIGGERS = '''
+DROP TRIGGER {through}_count_insert ON {through};
+DROP TRIGGER {through}_count_delete ON {through};
+DROP FUNCTION {through}_count_trigger();
+'''
+
+RELATIONS = (
+    {'table': 'core_tag', 'through': 'core_recipe_tags', 'column': 'tag_id'},
+    {
+        'table': 'core_ingredient',
+        'through': 'core_recipe_ingredients',
+        'column': 'ingredient_id',
+    },
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_recipe_image_content_storage'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            COUNT_TRIGGERS.format(**relation),
+            DROP_COUNT_TRIGGERS.format(**relation),
+        )
+        for relation in RELATIONS
+    ]
@@ -1,12 +1,24 @@
 import uuid
 import os
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVectorField,
+    TrigramSimilarity,
+)
 from django.db import models
+from django.db.models import Count, Exists, F, FloatField, OuterRef, Q
+from django.db.models.functions import Cast, Lower
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
 
+from core.storage import ContentAddressedStorage
+
 # recommended way to retrieve different settings from the
 # Django settings file so "settings" retrieve auth user model
 from django.conf import settings
@@ -76,7 +88,39 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "email"
 
 
-class Tag(models.Model):
+class RecipeAttrQuerySet(models.QuerySet):
+
+    def autocomplete(self, text):
+        """Filter by names starting with or similar to the text"""
+        # both conditions use the trigram index on lower(name) created
+        # in migration 0009, trigram similarity ignores case anyway
+        text = text.lower()
+        return self.annotate(
+            lower_name=Lower('name')
+        ).filter(
+            Q(lower_name__startswith=text) |
+            Q(lower_name__trigram_similar=text)
+        ).annotate(
+            similarity=TrigramSimilarity('lower_name', text)
+        ).order_by('-similarity', '-recipe_count', 'name')
+
+
+class RecipeCountMixin:
+    """Leave the recipe count out when saving an existing object"""
+
+    def save(self, *args, **kwargs):
+        # the count is only changed by the triggers of migration 0013,
+        # writing back the value read earlier would undo their changes
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'recipe_count'
+            ]
+
+        super().save(*args, **kwargs)
+
+
+class Tag(RecipeCountMixin, models.Model):
     """Tag to be used for a recipe"""
     name = models.CharField(max_length=255)
     # best practice method of retrieving the AUTH_USER_MODEL
@@ -85,23 +129,104 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=CASCADE,
     )
+    # the number of recipes using the tag, kept up to date by the
+    # signals in recipe.signals and the bulk recipe serializer
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = RecipeAttrQuerySet.as_manager()
+
+    class Meta:
+        # tags are always listed per user and ordered by name
+        indexes = [
+            models.Index(
+                fields=['user', 'name'],
+                name='core_tag_user_name_idx'
+            ),
+            models.Index(
+                fields=['user', '-recipe_count', 'id'],
+                name='core_tag_user_count_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(RecipeCountMixin, models.Model):
     """Ingredient to be used in a recipe"""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = RecipeAttrQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'name'],
+                name='core_ingredient_user_name_idx'
+            ),
+            models.Index(
+                fields=['user', '-recipe_count', 'id'],
+                name='core_ingredient_user_count_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+# text search configuration of Recipe.search_vector, the database
+# triggers in migration 0008 build the vector with the same one
+SEARCH_CONFIG = 'english'
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def search(self, text):
+        """Filter by a web search style query ordered by relevance"""
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        # ts_rank returns a real, cast it to a double precision so
+        # the value round trips exactly through pagination cursors
+        return self.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField())
+        ).order_by('-rank', '-id')
+
+    def related_to(self, field, ids, match_all=False):
+        """Filter by recipes related to any or all of the given objects"""
+        relation = self.model._meta.get_field(field)
+        target = relation.m2m_reverse_field_name()
+        rows = relation.remote_field.through.objects.filter(
+            **{f'{target}__in': ids}
+        )
+        if not match_all:
+            # EXISTS is a semi join so a recipe matching several of
+            # the objects is returned once, without a DISTINCT
+            return self.filter(Exists(rows.filter(recipe=OuterRef('pk'))))
+
+        # the recipes with a relation row for every object, a relation
+        # is unique per recipe and object so counting rows is enough
+        matching = rows.order_by().values('recipe').annotate(
+            count=Count(target)
+        ).filter(count=len(set(ids))).values('recipe')
+
+        return self.filter(pk__in=matching)
+
+
+class RecipeManager(models.Manager.from_queryset(RecipeQuerySet)):
+
+    def get_queryset(self):
+        # the search vector is only used inside the database so don't
+        # load it, deferred fields are also left out of save() which
+        # would otherwise write back a stale copy
+        return super().get_queryset().defer('search_vector')
+
+
 class Recipe(models.Model):
     """Recipe object"""
     user = models.ForeignKey(
@@ -114,7 +239,38 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # images are stored once per content, see core.storage
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        storage=ContentAddressedStorage()
+    )
+    # the sizes of the resized copies of the image rendered so far,
+    # see recipe.images
+    image_sizes = ArrayField(
+        models.PositiveIntegerField(), default=list, editable=False
+    )
+    # the title and the names of the tags and ingredients, kept up to
+    # date by database triggers so bulk inserts are covered as well
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeManager()
+
+    class Meta:
+        # recipes are listed per user newest first
+        indexes = [
+            models.Index(
+                fields=['user', 'id'],
+                name='core_recipe_user_id_idx'
+            ),
+            # finds the recipes sharing an image
+            models.Index(fields=['image'], name='core_recipe_image_idx'),
+            # btree_gin lets the user_id filter use the same index
+            GinIndex(
+                fields=['user', 'search_vector'],
+                name='core_recipe_search_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -0,0 +1,55 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+class ContentExists(Exception):
+    """The content is already stored under its name"""
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Store files under the SHA-256 digest of their content"""
+    # only the directory and extension of the name from upload_to are
+    # kept, files with the same bytes share one name so each content
+    # is stored once and a name always refers to the same bytes
+
+    def content_name(self, name, content):
+        """Return the name of the content in the directory of name"""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory = posixpath.dirname(name)
+        ext = posixpath.splitext(name)[1].lower()
+
+        # two levels of 256 directories keep the listings small
+        return posixpath.join(
+            directory, digest[:2], digest[2:4], f'{digest}{ext}'
+        )
+
+    def get_available_name(self, name, max_length=None):
+        # FileSystemStorage renames a file whose name is taken, also
+        # when a concurrent upload of the same bytes stored it between
+        # the check in save and the write, here the name is kept
+        if self.exists(name):
+            raise ContentExists(name)
+
+        return name
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = self.content_name(name, content)
+        try:
+            return super().save(name, content, max_length)
+        except ContentExists:
+            # refresh the modification time, the garbage collection
+            # leaves recently used files alone
+            os.utime(self.path(name))
+            return name
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TransactionTestCase
+
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.async_views import async_read_patterns, async_read_view
+from core.models import Tag
+from recipe.urls import routers
+from recipe.views import TagViewSet
+
+
+def thread_name_view(request):
+    return HttpResponse(threading.current_thread().name)
+
+
+class AsyncViewsTests(TransactionTestCase):
+    """Test serving sync views from async views"""
+    # the views run in other threads with their own connections,
+    # they only see committed rows
+
+    def setUp(self):
+        # the threads outlive the test, their connections must not
+        # or the test database can't be dropped
+        settings = patch.dict(connection.settings_dict, CONN_MAX_AGE=0)
+        settings.start()
+        self.addCleanup(settings.stop)
+        self.factory = APIRequestFactory()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass'
+        )
+
+    def test_reads_run_in_thread_pool(self):
+        """Test reads run in the pool and writes in the shared thread"""
+        view = async_read_view(thread_name_view)
+
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        read = async_to_sync(view)(self.factory.get('/'))
+        write = async_to_sync(view)(self.factory.post('/'))
+        self.assertNotEqual(read.content, write.content)
+        self.assertTrue(read.content.startswith(b'asyncio'))
+
+    def test_read_drf_view(self):
+        """Test a DRF list is rendered by the async view"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        view = async_read_view(
+            TagViewSet.as_view({'get': 'list'}, basename='tag')
+        )
+        request = self.factory.get('/api/recipe/tags/')
+        force_authenticate(request, self.user)
+
+        res = async_to_sync(view)(request)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(b'Vegan', res.content)
+
+    def test_async_read_patterns(self):
+        """Test the patterns keep their names and CSRF exemption"""
+        patterns = async_read_patterns(routers.urls)
+
+        self.assertEqual(
+            [pattern.name for pattern in patterns],
+            [pattern.name for pattern in routers.urls]
+        )
+        for pattern in patterns:
+            self.assertTrue(asyncio.iscoroutinefunction(pattern.callback))
+            self.assertTrue(pattern.callback.csrf_exempt)
@@ -1,16 +1,24 @@
 # Allow us to mock the behavior of the Django get database function
 # can simulate the database being available and not being
 # available for wen we test our command
-from unittest.mock import patch
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest.mock import MagicMock, patch
 
 # allow us to call the command in our source code
 from django.core.management import call_command
+from django.core.management.base import CommandError
 
 # import the operational error that Django throws when the
 # database is unavailable
 # to simulate the database being avaliable or not when we run our command
+from django.contrib.auth import get_user_model
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import TestCase, override_settings
+
+from core.models import Tag, Ingredient, Recipe
 
 
 class CommandTests(TestCase):
@@ -27,16 +35,13 @@ class CommandTests(TestCase):
             # actually before performing whatever
             # behavior __getitem__ in Django
             # it will override it and just replace it with
-            # a mock object which does two things
-            # 1) return gi.return_value = True value that we specify
-            # 2) allow us monitor how many times it was called
-            # and the differrnt calls that were made to it
-            gi.return_value = True
-            # wait_for_db the name of the management command that we create
-            call_command("wait_for_db")
-            # create assertions of our test
-            # __getitem__ set to call once
-            self.assertEqual(gi.call_count, 1)
+            # a mock object which lets us monitor how many times
+            # a cursor was opened and which queries it ran
+            call_command("wait_for_db", stdout=StringIO())
+            # the database is only available once it answers a query
+            self.assertEqual(gi.return_value.cursor.call_count, 1)
+            cursor = gi.return_value.cursor.return_value.__enter__()
+            cursor.execute.assert_called_once_with('SELECT 1')
 
     # it is replaces the behavior of time.sleep and just replace it
     # with a mock function thet return True
@@ -52,9 +57,191 @@ class CommandTests(TestCase):
         # because it'll have an unexpected argument
         """Test waiting for db"""
         with patch("django.db.utils.ConnectionHandler.__getitem__") as gi:
-            # that the five times call this __getitem__
+            # that the five times a cursor is opened
             # it's going to raise the OperationalError
             # on the sixth time it won't raise the error it will just return
-            gi.side_effect = [OperationalError] * 5 + [True]
-            call_command("wait_for_db")
-            self.assertEqual(gi.call_count, 6)
+            gi.return_value.cursor.side_effect = (
+                [OperationalError] * 5 + [MagicMock()]
+            )
+            call_command("wait_for_db", stdout=StringIO())
+            self.assertEqual(gi.return_value.cursor.call_count, 6)
+
+        # the waits start in the tens of milliseconds and grow
+        delays = [call[0][0] for call in ts.call_args_list]
+        self.assertEqual(len(delays), 5)
+        self.assertTrue(0.025 <= delays[0] <= 0.05)
+        self.assertTrue(0.4 <= delays[4] <= 0.8)
+
+    @patch("time.sleep", return_value=True)
+    def test_wait_for_db_max_delay(self, ts):
+        """Test the waits don't grow longer than the maximum delay"""
+        with patch("django.db.utils.ConnectionHandler.__getitem__") as gi:
+            gi.return_value.cursor.side_effect = (
+                [OperationalError] * 20 + [MagicMock()]
+            )
+            call_command("wait_for_db", max_delay=1, stdout=StringIO())
+
+        self.assertTrue(all(call[0][0] <= 1 for call in ts.call_args_list))
+
+    def test_wait_for_db_timeout(self):
+        """Test the command fails once the timeout has passed"""
+        with patch("django.db.utils.ConnectionHandler.__getitem__") as gi:
+            gi.return_value.cursor.side_effect = OperationalError
+
+            with self.assertRaises(CommandError):
+                call_command("wait_for_db", timeout=0, stdout=StringIO())
+
+    @patch("time.sleep", return_value=True)
+    def test_wait_for_migrations(self, ts):
+        """Test waiting until every migration is applied"""
+        with patch(
+            "core.management.commands.wait_for_db.Command"
+            ".unapplied_migrations",
+            side_effect=[3, 0]
+        ) as unapplied:
+            out = StringIO()
+            call_command("wait_for_db", migrations=True, stdout=out)
+
+        self.assertEqual(unapplied.call_count, 2)
+        self.assertIn('3 migrations not applied', out.getvalue())
+
+    def test_migrations_applied(self):
+        """Test the migrations of the test database are applied"""
+        call_command("wait_for_db", migrations=True, stdout=StringIO())
+
+
+class BenchmarkCommandTests(TestCase):
+    """Test seeding and benchmarking a dataset"""
+
+    def test_seed_recipes(self):
+        """Test seeding users with recipes, tags and ingredients"""
+        call_command(
+            'seed_recipes',
+            users=2,
+            recipes=20,
+            tags=5,
+            ingredients=6,
+            stdout=StringIO()
+        )
+
+        self.assertEqual(Recipe.objects.count(), 20)
+        self.assertEqual(Tag.objects.count(), 10)
+        self.assertEqual(Ingredient.objects.count(), 12)
+        recipe = Recipe.objects.first()
+        self.assertEqual(recipe.tags.count(), 3)
+        self.assertEqual(recipe.ingredients.count(), 5)
+        self.assertEqual(
+            set(recipe.tags.values_list('user', flat=True)),
+            {recipe.user_id}
+        )
+
+    def test_benchmark_queries(self):
+        """Test benchmarking prints timings and plans"""
+        call_command(
+            'seed_recipes', users=1, recipes=10, stdout=StringIO()
+        )
+        out = StringIO()
+        call_command(
+            'benchmark_queries',
+            repeat=2,
+            scenario=['recipes_list'],
+            stdout=out
+        )
+
+        self.assertIn('recipes_list: median', out.getvalue())
+        self.assertIn('Execution Time', out.getvalue())
+
+
+class PruneImagesCommandTests(TestCase):
+    """Test removing the recipe images no recipe refers to"""
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            MEDIA_ROOT=self.media_root.name,
+            RECIPE_IMAGE_UPLOAD_DIR=os.path.join(self.media_root.name, 'tmp')
+        )
+        self.settings.enable()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass'
+        )
+        self.old = time.time() - 2 * 24 * 60 * 60
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def _file(self, name, mtime=None):
+        path = os.path.join(self.media_root.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'x' * 10)
+        mtime = self.old if mtime is None else mtime
+        os.utime(path, (mtime, mtime))
+        os.utime(os.path.dirname(path), (mtime, mtime))
+
+        return path
+
+    def _exists(self, name):
+        return os.path.exists(os.path.join(self.media_root.name, name))
+
+    def _use(self, name):
+        Recipe.objects.create(
+            user=self.user, title='Toast', time_minutes=2, price=1.00,
+            image=name
+        )
+
+    def test_prune_images(self):
+        """Test orphaned images and copies are removed"""
+        self._use('upload/recipe/ab/cd/abcd1.jpg')
+        self._use('upload/recipe/legacy.png')
+        self._file('upload/recipe/ab/cd/abcd1.jpg')
+        self._file('derivative/recipe/abcd1/128.jpg')
+        self._file('upload/recipe/legacy.png')
+        self._file('resized/recipe/legacy/320.jpg')
+        self._file('upload/recipe/ab/cd/abcd2.jpg')
+        self._file('derivative/recipe/abcd2/128.jpg')
+        self._file('resized/recipe/gone/320.jpg')
+        self._file('upload/recipe/new.jpg', mtime=time.time())
+        self._file('tmp/a.upload.jpg')
+
+        out = StringIO()
+        call_command('prune_images', batch_size=2, stdout=out)
+
+        for name in ('upload/recipe/ab/cd/abcd1.jpg',
+                     'derivative/recipe/abcd1/128.jpg',
+                     'upload/recipe/legacy.png',
+                     'resized/recipe/legacy/320.jpg',
+                     'upload/recipe/new.jpg'):
+            self.assertTrue(self._exists(name), name)
+        for name in ('upload/recipe/ab/cd/abcd2.jpg',
+                     'derivative/recipe/abcd2',
+                     'resized/recipe/gone',
+                     'tmp/a.upload.jpg'):
+            self.assertFalse(self._exists(name), name)
+        self.assertIn('Removed 4', out.getvalue())
+
+    def test_prune_images_dry_run(self):
+        """Test a dry run lists the orphans without removing them"""
+        self._file('upload/recipe/ab/cd/abcd2.jpg')
+
+        out = StringIO()
+        call_command('prune_images', dry_run=True, stdout=out)
+
+        self.assertTrue(self._exists('upload/recipe/ab/cd/abcd2.jpg'))
+        self.assertIn('upload/recipe/ab/cd/abcd2.jpg', out.getvalue())
+        self.assertIn('Would remove 1', out.getvalue())
+
+    def test_prune_images_quarantine(self):
+        """Test orphans are moved to the quarantine directory"""
+        self._file('upload/recipe/ab/cd/abcd2.jpg')
+
+        with tempfile.TemporaryDirectory() as quarantine:
+            call_command(
+                'prune_images', quarantine=quarantine, stdout=StringIO()
+            )
+
+            self.assertFalse(self._exists('upload/recipe/ab/cd/abcd2.jpg'))
+            self.assertTrue(os.path.exists(os.path.join(
+                quarantine, 'upload/recipe/ab/cd/abcd2.jpg'
+            )))
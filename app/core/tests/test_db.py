@@ -0,0 +1,164 @@
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.db.utils import OperationalError
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.db.base import DatabaseWrapper
+from core.db.pool import close_inherited, connection_stats, pools
+
+
+METRICS_URL = reverse('recipe:database-metrics')
+
+
+class DatabaseBackendTests(TestCase):
+    """Test the persistent and pooled database connections"""
+
+    def setUp(self):
+        self.wrappers = []
+        for alias in ('test-kept', 'test-pool'):
+            # django.contrib.postgres looks the alias up when a
+            # connection is created, it gets a plain connection
+            connections.databases[alias] = dict(
+                connection.settings_dict, POOL_SIZE=0
+            )
+            connections[alias].ensure_connection()
+            connections[alias].close()
+            connection_stats.pop(alias)
+
+    def tearDown(self):
+        for wrapper in self.wrappers:
+            wrapper.close()
+        for alias in ('test-kept', 'test-pool'):
+            del connections[alias]
+            del connections.databases[alias]
+            connection_stats.pop(alias, None)
+            pool = pools.pop(alias, None)
+            if pool is not None:
+                pool.close_idle()
+
+    def _wrapper(self, alias, **settings):
+        wrapper = DatabaseWrapper(
+            {**connection.settings_dict, **settings}, alias=alias
+        )
+        self.wrappers.append(wrapper)
+
+        return wrapper
+
+    def _terminate(self, wrapper):
+        """Close the server side of the wrapper's connection"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_terminate_backend(%s)',
+                [wrapper.connection.get_backend_pid()]
+            )
+
+    def test_kept_connection_health_checked(self):
+        """Test a dead kept connection is replaced before it is used"""
+        wrapper = self._wrapper(
+            'test-kept', CONN_MAX_AGE=60, HEALTH_CHECKS=True, POOL_SIZE=0
+        )
+        wrapper.ensure_connection()
+        # the end of a request keeps the connection for the next one
+        wrapper.close_if_unusable_or_obsolete()
+        self._terminate(wrapper)
+
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+        stats = connection_stats['test-kept']
+        self.assertEqual(stats['health_check_failures'], 1)
+        self.assertEqual(stats['opened'], 2)
+
+    def test_pooled_connection_reused(self):
+        """Test a connection returns to the pool at the end of a request"""
+        first = self._wrapper('test-pool', POOL_SIZE=1, CONN_MAX_AGE=60)
+        second = self._wrapper('test-pool', POOL_SIZE=1, CONN_MAX_AGE=60)
+        first.ensure_connection()
+        raw = first.connection
+
+        first.close_if_unusable_or_obsolete()
+        second.ensure_connection()
+
+        self.assertIsNone(first.connection)
+        self.assertIs(second.connection, raw)
+        metrics = pools['test-pool'].metrics()
+        self.assertEqual(metrics['checkouts'], 2)
+        self.assertEqual(metrics['in_use'], 1)
+        self.assertEqual(connection_stats['test-pool']['opened'], 1)
+
+    def test_pool_timeout(self):
+        """Test waiting for a connection of a full pool times out"""
+        first = self._wrapper('test-pool', POOL_SIZE=1, POOL_TIMEOUT=0.01)
+        second = self._wrapper('test-pool', POOL_SIZE=1, POOL_TIMEOUT=0.01)
+        first.ensure_connection()
+
+        with self.assertRaises(OperationalError):
+            second.ensure_connection()
+
+        self.assertEqual(pools['test-pool'].metrics()['timeouts'], 1)
+
+    def test_pooled_connection_in_transaction_discarded(self):
+        """Test a connection left in a transaction isn't shared"""
+        wrapper = self._wrapper('test-pool', POOL_SIZE=1)
+        wrapper.ensure_connection()
+        wrapper.connection.autocommit = False
+        with wrapper.connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+        wrapper.close()
+
+        self.assertEqual(pools['test-pool'].metrics()['idle'], 0)
+        self.assertEqual(connection_stats['test-pool']['closed'], 1)
+
+    def test_dead_pooled_connection_replaced(self):
+        """Test a pooled connection is health checked when checked out"""
+        wrapper = self._wrapper('test-pool', POOL_SIZE=1, HEALTH_CHECKS=True)
+        wrapper.ensure_connection()
+        wrapper.close_if_unusable_or_obsolete()
+        raw = pools['test-pool']._idle[0][0]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_terminate_backend(%s)', [raw.get_backend_pid()]
+            )
+
+        wrapper.ensure_connection()
+
+        self.assertIsNot(wrapper.connection, raw)
+        self.assertEqual(
+            connection_stats['test-pool']['health_check_failures'], 1
+        )
+
+    def test_close_inherited_pools(self):
+        """Test a forked process closes the pooled connections it got"""
+        wrapper = self._wrapper('test-pool', POOL_SIZE=1)
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close_if_unusable_or_obsolete()
+
+        close_inherited()
+
+        self.assertNotIn('test-pool', pools)
+        self.assertTrue(raw.closed)
+
+    def test_metrics_admin_only(self):
+        """Test the database metrics are only reported to admins"""
+        client = APIClient()
+        user = get_user_model().objects.create_user('a@gmail.com', 'pass')
+        client.force_authenticate(user)
+
+        res = client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        user.is_staff = True
+        user.save()
+        self._wrapper('test-pool', POOL_SIZE=2).ensure_connection()
+        res = client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['test-pool']['pool']['size'], 2)
+        self.assertEqual(res.data['test-pool']['connections_opened'], 1)
@@ -0,0 +1,179 @@
+import threading
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from core.checks import check_replica_sticky_cache
+from core.db import router
+from core.db.router import (
+    ReplicaMiddleware, on_replicated, replayed, replica_lag
+)
+from core.models import Tag
+
+
+REPLICAS = ['replica1', 'replica2']
+
+
+@override_settings(
+    DATABASE_REPLICAS=REPLICAS,
+    DATABASE_REPLICA_STICKY_SECONDS=10,
+    DATABASE_REPLICA_MAX_LAG=5,
+    DATABASE_REPLICA_CHECK_INTERVAL=60,
+)
+class ReplicaRouterTests(TestCase):
+    """Test routing the reads of safe requests to the replicas"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass'
+        )
+        self.lags = {'replica1': 0, 'replica2': 0}
+        lag = patch.object(router, 'replica_lag', self.lags.get)
+        lag.start()
+        self.addCleanup(lag.stop)
+        router._health.clear()
+        self.addCleanup(router._health.clear)
+        cache.clear()
+
+    def _databases(self, method='get', token='token-1', write=False,
+                   lock=False):
+        """Return the databases reads go to while serving a request"""
+        databases = {}
+
+        def view(request):
+            if write:
+                Tag.objects.get_or_create(user=self.user, name='Vegan')
+            databases['read'] = Tag.objects.all().db
+            if lock:
+                databases['locked'] = Tag.objects.select_for_update().db
+            return HttpResponse()
+
+        request = getattr(self.factory, method)(
+            '/', HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        ReplicaMiddleware(view)(request)
+
+        return databases
+
+    def test_reads_round_robin(self):
+        """Test safe requests read from the replicas in turn"""
+        reads = {self._databases()['read'] for _ in range(4)}
+
+        self.assertEqual(reads, set(REPLICAS))
+
+    def test_select_for_update_primary(self):
+        """Test select_for_update always goes to the primary"""
+        self.assertEqual(self._databases(lock=True)['locked'], 'default')
+
+    def test_unsafe_request_primary(self):
+        """Test requests that may write read from the primary"""
+        self.assertEqual(self._databases('post')['read'], 'default')
+
+    def test_outside_request_primary(self):
+        """Test reads outside of requests go to the primary"""
+        self.assertEqual(Tag.objects.all().db, 'default')
+
+    def test_sticky_after_write(self):
+        """Test a client reads from the primary for a while after writing"""
+        self._databases('post', write=True)
+
+        self.assertEqual(self._databases()['read'], 'default')
+        self.assertIn(self._databases(token='token-2')['read'], REPLICAS)
+
+        with self.settings(DATABASE_REPLICA_STICKY_SECONDS=0):
+            self._databases('post', write=True)
+        self.assertIn(self._databases()['read'], REPLICAS)
+
+    def test_unhealthy_replica_skipped(self):
+        """Test replicas that are down or behind aren't read from"""
+        self.lags['replica1'] = None
+        self.lags['replica2'] = 30
+
+        self.assertEqual(self._databases()['read'], 'default')
+
+        router._health.clear()
+        self.lags['replica2'] = 1
+        reads = {self._databases()['read'] for _ in range(4)}
+
+        self.assertEqual(reads, {'replica2'})
+
+    def test_database_cache_primary(self):
+        """Test database caches use the primary and don't stick"""
+        entry = DatabaseCache('cache_table', {}).cache_model_class
+        databases = {}
+
+        def view(request):
+            databases['cache'] = router.ReplicaRouter().db_for_read(entry)
+            router.ReplicaRouter().db_for_write(entry)
+            databases['read'] = Tag.objects.all().db
+            return HttpResponse()
+
+        ReplicaMiddleware(view)(
+            self.factory.get('/', HTTP_AUTHORIZATION='Token token-1')
+        )
+
+        self.assertEqual(databases['cache'], 'default')
+        self.assertIn(databases['read'], REPLICAS)
+        self.assertIn(self._databases()['read'], REPLICAS)
+
+    def test_sticky_cache_shared(self):
+        """Test replicas need a sticky cache shared by the workers"""
+        caches = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'shared': {
+                'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                'LOCATION': 'cache_table',
+            },
+        }
+        with self.settings(
+            CACHES=caches, DATABASE_REPLICA_STICKY_CACHE='default'
+        ):
+            errors = check_replica_sticky_cache(None)
+        self.assertEqual([error.id for error in errors], ['core.E001'])
+
+        with self.settings(
+            CACHES=caches, DATABASE_REPLICA_STICKY_CACHE='shared'
+        ):
+            self.assertEqual(check_replica_sticky_cache(None), [])
+
+    def test_replica_lag(self):
+        """Test a server that isn't a standby has no lag"""
+        self.assertEqual(replica_lag('default'), 0)
+
+    def test_replayed(self):
+        """Test a server that isn't a standby has replayed everything"""
+        self.assertTrue(replayed('default', 'FFFFFFFF/FFFFFFFF'))
+
+    @patch.object(router, 'REPLAY_POLL_INTERVAL', 0)
+    def test_on_replicated_waits_for_replicas(self):
+        """Test a call waits until every replica replayed the writes"""
+        checks = []
+        called = threading.Event()
+
+        def replica_replayed(alias, lsn):
+            checks.append(alias)
+            return len(checks) > 2
+
+        with patch.object(router, 'replayed', replica_replayed):
+            on_replicated(called.set)
+            self.assertTrue(called.wait(5))
+
+        # both are checked until they replayed the position
+        self.assertEqual(checks, ['replica1', 'replica2', 'replica1',
+                                  'replica2'])
+
+    def test_on_replicated_without_replicas(self):
+        """Test a call without replicas happens right away"""
+        called = []
+
+        with self.settings(DATABASE_REPLICAS=[]):
+            on_replicated(lambda: called.append(True))
+
+        self.assertEqual(called, [True])
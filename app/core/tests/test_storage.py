@@ -0,0 +1,63 @@
+import hashlib
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from core.storage import ContentAddressedStorage
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Test storing files by the digest of their content"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = ContentAddressedStorage(location=self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_name_from_content(self):
+        """Test files are named after their digest in shard directories"""
+        digest = hashlib.sha256(b'photo').hexdigest()
+
+        name = self.storage.save('upload/recipe/a.JPG', ContentFile(b'photo'))
+
+        self.assertEqual(
+            name, f'upload/recipe/{digest[:2]}/{digest[2:4]}/{digest}.jpg'
+        )
+        with self.storage.open(name) as file:
+            self.assertEqual(file.read(), b'photo')
+
+    def test_same_content_stored_once(self):
+        """Test saving the same bytes again reuses the stored file"""
+        name1 = self.storage.save('upload/recipe/a.jpg', ContentFile(b'x'))
+        os.utime(self.storage.path(name1), (0, 0))
+
+        name2 = self.storage.save('upload/recipe/b.jpg', ContentFile(b'x'))
+        name3 = self.storage.save('upload/recipe/c.jpg', ContentFile(b'y'))
+
+        self.assertEqual(name1, name2)
+        self.assertNotEqual(name1, name3)
+        # reusing a file marks it as recently used
+        self.assertGreater(os.path.getmtime(self.storage.path(name1)), 0)
+        shard = os.path.dirname(self.storage.path(name1))
+        self.assertEqual(len(os.listdir(shard)), 1)
+
+    def test_concurrent_save_same_content(self):
+        """Test a file stored after the check is reused, not renamed"""
+        name = self.storage.save('upload/recipe/a.jpg', ContentFile(b'x'))
+
+        # another upload stored the bytes after this one checked
+        with patch.object(
+            self.storage, 'exists', side_effect=[False, True]
+        ):
+            name2 = self.storage.save(
+                'upload/recipe/b.jpg', ContentFile(b'x')
+            )
+
+        self.assertEqual(name2, name)
+        shard = os.path.dirname(self.storage.path(name))
+        self.assertEqual(os.listdir(shard), [os.path.basename(name)])
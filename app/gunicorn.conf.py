@@ -0,0 +1,80 @@
+"""
+Gunicorn config of the production server.
+
+Run it from the app directory with ``gunicorn --config gunicorn.conf.py``,
+the settings below are read from the environment.
+
+For more information on the settings, see
+https://docs.gunicorn.org/en/stable/settings.html
+"""
+
+import os
+import sys
+
+
+def _cores():
+    # the cores the container may run on rather than every core of
+    # the host
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# app.wsgi:application, or app.asgi:application together with
+# WEB_WORKER_CLASS=uvicorn.workers.UvicornWorker
+wsgi_app = os.environ.get('WEB_APP', 'app.wsgi:application')
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+
+# processes and threads per process, the threads wait on the database
+# while another thread of the process runs Python
+workers = int(os.environ.get('WEB_CONCURRENCY', _cores() * 2 + 1))
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+# Django is imported and set up once in the arbiter, the workers are
+# forked from it with the modules already loaded and share their
+# memory pages until they write to them
+preload_app = True
+
+# workers are replaced after this many requests, the jitter keeps
+# them from restarting at the same time
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 500))
+
+# on SIGTERM workers stop accepting connections and get this many
+# seconds to finish the requests they have
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-')
+
+
+def on_starting(server):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+    from django.conf import settings
+
+    # a write in one worker has to invalidate the cached responses of
+    # the others, each worker has its own in-process cache
+    backend = settings.CACHES['api_responses']['BACKEND']
+    if server.cfg.workers > 1 and backend.endswith('.LocMemCache'):
+        server.log.error(
+            'API_RESPONSE_CACHE is locmem, the %d workers would serve '
+            'stale responses, set it to file or db', server.cfg.workers
+        )
+        sys.exit(1)
+
+
+def post_fork(server, worker):
+    from django.db import connections
+
+    from core.db.pool import close_inherited
+
+    # a connection opened while the app was loaded must not be shared
+    # by the workers, pooled ones are closed instead of being released
+    # to the pool the worker inherited
+    close_inherited()
+    for connection in connections.all():
+        connection.pool = None
+    connections.close_all()
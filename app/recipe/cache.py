@@ -0,0 +1,154 @@
+import functools
+import hashlib
+import threading
+import uuid
+from collections import Counter, defaultdict
+
+from django.core.cache import caches
+from django.db import transaction
+
+from rest_framework.response import Response
+
+from core.db.router import on_replicated
+
+
+# name of the cache in settings.CACHES holding API responses
+RESPONSE_CACHE = 'api_responses'
+
+HIT = 'hits'
+MISS = 'misses'
+
+# hits and misses per endpoint of this process, counting them in the
+# shared cache would cost more round trips than a hit saves
+response_stats = defaultdict(Counter)
+_stats_lock = threading.Lock()
+
+
+def _version_key(user_id):
+    return f'version:{user_id}'
+
+
+def get_user_version(user_id):
+    """Return the current version of everything the user owns"""
+    cache = caches[RESPONSE_CACHE]
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # versions are random rather than a counter so a version that
+        # was evicted from the cache can never come back with a value
+        # that old responses were stored under
+        version = uuid.uuid4().hex
+        if not cache.add(_version_key(user_id), version, timeout=None):
+            version = cache.get(_version_key(user_id), version)
+
+    return version
+
+
+def _set_new_version(user_id):
+    caches[RESPONSE_CACHE].set(
+        _version_key(user_id), uuid.uuid4().hex, timeout=None
+    )
+
+
+def _bump_committed(user_id):
+    _set_new_version(user_id)
+    # and once more when the replicas have it, a request reading
+    # from a replica that is behind may have stored the old rows
+    # under the new version
+    on_replicated(lambda: _set_new_version(user_id))
+
+
+def bump_user_version(user_id):
+    """Invalidate every cached response of the user"""
+    _set_new_version(user_id)
+    # bump again once the change is committed, a request that read
+    # the new version before the commit may have stored the old rows
+    transaction.on_commit(lambda: _bump_committed(user_id))
+
+
+def request_version(request, refresh=False):
+    """Return the version of the request's user, read once per request"""
+    # the ETag and the cache key of a list both need it, refresh reads
+    # it again after the request changed the user's data
+    if refresh or not hasattr(request, '_user_version'):
+        request._user_version = get_user_version(request.user.id)
+
+    return request._user_version
+
+
+def versioned_digest(request, *parts):
+    """Return a digest that changes whenever the user's data changes"""
+    raw = '|'.join(
+        (str(request.user.id), request_version(request)) + parts
+    )
+
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def request_digest(request, endpoint):
+    """Return the versioned digest of a request to endpoint"""
+    # the order of query parameters doesn't change the response
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+    )
+
+    return versioned_digest(
+        request,
+        endpoint,
+        # the host is part of the pagination links in the response
+        request.get_host(),
+        request.path,
+        repr(params),
+    )
+
+
+def response_cache_key(request, endpoint):
+    """Return the cache key of a request to endpoint"""
+    return f'response:{request_digest(request, endpoint)}'
+
+
+def record(endpoint, result):
+    """Count a cache hit or miss for the endpoint"""
+    with _stats_lock:
+        response_stats[endpoint][result] += 1
+
+
+def get_metrics(endpoints):
+    """Return the hit and miss counts of the endpoints in this process"""
+    with _stats_lock:
+        return {
+            endpoint: {
+                result: response_stats[endpoint][result]
+                for result in (HIT, MISS)
+            }
+            for endpoint in endpoints
+        }
+
+
+class CachedListMixin:
+    """Serve list responses from the per user response cache"""
+
+    def cached_response(self, request, endpoint, get_response):
+        """Return the cached response or store the one get_response returns"""
+        cache = caches[RESPONSE_CACHE]
+        key = response_cache_key(request, endpoint)
+        data = cache.get(key)
+        if data is not None:
+            record(endpoint, HIT)
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        response = get_response()
+        if response.status_code == 200:
+            cache.set(key, response.data)
+        record(endpoint, MISS)
+        response['X-Cache'] = 'MISS'
+
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            self.basename,
+            functools.partial(super().list, request, *args, **kwargs)
+        )
@@ -0,0 +1,108 @@
+from django.db import transaction
+from django.utils.cache import parse_etags, quote_etag
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipe.cache import request_digest, request_version, versioned_digest
+
+
+class ConditionalRequestMixin:
+    """Handle If-None-Match and If-Match with per user ETags"""
+    # the ETags come from the user's data version in recipe.cache
+    # instead of a hash of the rendered body so a matching request
+    # is answered before any query or serializer runs
+
+    def get_list_etag(self, request):
+        return quote_etag(request_digest(request, self.basename))
+
+    def get_detail_etag(self, request):
+        return quote_etag(versioned_digest(
+            request,
+            self.basename,
+            str(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        ))
+
+    def _not_modified(self, request, etag):
+        """Return a 304 response if the client has the current version"""
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is None:
+            return None
+
+        # If-None-Match uses the weak comparison
+        etags = [
+            tag[2:] if tag.startswith('W/') else tag
+            for tag in parse_etags(if_none_match)
+        ]
+        if '*' in etags or etag in etags:
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED,
+                headers={'ETag': etag}
+            )
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_etag(request)
+        response = self._not_modified(request, etag)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+            response['ETag'] = etag
+
+        return response
+
+    def _object_filter(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+
+        return {
+            'user': self.request.user,
+            self.lookup_field: self.kwargs[lookup_url_kwarg],
+        }
+
+    def retrieve(self, request, *args, **kwargs):
+        etag = self.get_detail_etag(request)
+        response = self._not_modified(request, etag)
+        # the tag comes from the URL so check the object exists, a
+        # missing one is answered with 404 by super().retrieve
+        if response is None or not self.get_queryset().filter(
+            **self._object_filter()
+        ).exists():
+            response = super().retrieve(request, *args, **kwargs)
+            response['ETag'] = etag
+
+        return response
+
+    def update(self, request, *args, **kwargs):
+        if_match = request.headers.get('If-Match')
+        if if_match is None:
+            response = super().update(request, *args, **kwargs)
+        else:
+            with transaction.atomic():
+                response = self._update_if_match(
+                    request, if_match, *args, **kwargs
+                )
+
+        if response.status_code == status.HTTP_200_OK:
+            # the update changed the version so hand out the new tag,
+            # read after the commit which changes it once more
+            request_version(request, refresh=True)
+            response['ETag'] = self.get_detail_etag(request)
+
+        return response
+
+    def _update_if_match(self, request, if_match, *args, **kwargs):
+        # concurrent updates of the object wait for each other here,
+        # the first one changes the version so the others fail
+        model = self.get_queryset().model
+        list(model.objects.select_for_update().filter(
+            **self._object_filter()
+        ).values_list('pk'))
+
+        # If-Match uses the strong comparison so a client can only
+        # update the version of the object it last read
+        etags = parse_etags(if_match)
+        if '*' not in etags and self.get_detail_etag(request) not in etags:
+            return Response(
+                {'detail': 'The recipe was changed by another request.'},
+                status=status.HTTP_412_PRECONDITION_FAILED
+            )
+
+        return super().update(request, *args, **kwargs)
@@ -0,0 +1,25 @@
+from django.contrib.postgres.aggregates.mixins import OrderableAggMixin
+from django.db.models import Aggregate, F, Func, JSONField, Value
+
+
+class JSONBBuildObject(Func):
+    """Build a JSON object out of the given model fields"""
+    function = 'JSONB_BUILD_OBJECT'
+    output_field = JSONField()
+
+    def __init__(self, *fields, **extra):
+        # jsonb_build_object takes alternating keys and values
+        # e.g. jsonb_build_object('id', "id", 'name', "name")
+        expressions = []
+        for field in fields:
+            expressions.extend((Value(field), F(field)))
+        super().__init__(*expressions, **extra)
+
+
+class JSONBAgg(OrderableAggMixin, Aggregate):
+    """Aggregate rows into a JSON array in the given order"""
+    # django.contrib.postgres JSONBAgg can't be ordered yet
+    function = 'JSONB_AGG'
+    template = '%(function)s(%(distinct)s%(expressions)s %(ordering)s)'
+    allow_distinct = True
+    output_field = JSONField()
@@ -0,0 +1,324 @@
+import fcntl
+import logging
+import multiprocessing
+import os
+import posixpath
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+import django
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from core.models import Recipe
+
+from recipe.cache import bump_user_version
+
+
+logger = logging.getLogger(__name__)
+
+# Pillow format name -> file extension of the derivatives
+FORMATS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+# a cached copy is marked as used at most this often, in seconds
+TOUCH_INTERVAL = 60 * 60
+# the size of the cache is counted again this often, in seconds, to
+# notice the copies written by the other processes
+RESCAN_INTERVAL = 60
+# images stored this recently, in seconds, are not removed when a
+# recipe stops using them, another upload may be about to share them
+RECENTLY_STORED = 10 * 60
+# eviction removes copies until the cache is down to this part of
+# its maximum size so it doesn't run again for every new copy
+EVICT_TO = 0.9
+# seconds a request waits for a render, the render goes on and the
+# copy is served to the requests after it
+RENDER_TIMEOUT = 30
+
+_executor = None
+
+# renders in progress in this process by name, and the size of the
+# cache of resized copies as last counted
+_renders = {}
+_cache_size = None
+_cache_scanned = 0
+_lock = threading.Lock()
+
+
+def derivative_name(name, size, image_format):
+    """Return the storage name of a resized copy of the image"""
+    # every image gets its own directory so its copies can be
+    # removed together
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+
+    return f'derivative/recipe/{stem}/{size}.{FORMATS[image_format]}'
+
+
+def render_derivatives(source, targets):
+    """Write the resized copies of the source image to the targets"""
+    # runs in a worker process, targets is a list of
+    # (size, format, path) and the sizes rendered are returned
+    sizes = sorted({size for size, _, _ in targets}, reverse=True)
+    with Image.open(source) as image:
+        # JPEG images are decoded at the smallest scale that is still
+        # at least as large as the largest copy instead of full size
+        image.draft('RGB', (sizes[0], sizes[0]))
+        image = image.convert('RGB')
+
+    for size in sizes:
+        # every copy is scaled down from the previous larger one
+        image.thumbnail((size, size), Image.LANCZOS)
+        for target_size, image_format, path in targets:
+            if target_size != size:
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written under a temporary name and renamed so a copy is
+            # never served half written
+            tmp_path = f'{path}.tmp'
+            image.save(tmp_path, format=image_format, quality=85)
+            os.replace(tmp_path, path)
+
+    return sorted(sizes)
+
+
+def resized_name(name, width, image_format):
+    """Return the storage name of the image resized to the width"""
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+
+    return f'resized/recipe/{stem}/{width}.{FORMATS[image_format]}'
+
+
+def render_width(source, width, image_format, path):
+    """Write a copy of the source image scaled down to the width"""
+    # runs in a worker process and returns the size of the file, the
+    # lock next to it makes sure only one process renders a copy
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.lock', 'wb') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(path):
+            with Image.open(source) as image:
+                # decoded at the smallest JPEG scale at least as wide
+                image.draft('RGB', (
+                    width, max(image.height * width // image.width, 1)
+                ))
+                image = image.convert('RGB')
+            image.thumbnail((width, image.height), Image.LANCZOS)
+            tmp_path = f'{path}.tmp'
+            image.save(tmp_path, format=image_format, quality=85)
+            os.replace(tmp_path, path)
+
+    return os.path.getsize(path)
+
+
+def get_executor():
+    """Return the process pool rendering the derivatives"""
+    global _executor
+    if _executor is None:
+        # forked workers would share the database connection of the
+        # process, the fork server starts them without it
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context('forkserver'),
+            initializer=django.setup
+        )
+
+    return _executor
+
+
+def _store_sizes(recipe, name, future):
+    """Record the rendered sizes once the worker is done"""
+    try:
+        sizes = future.result()
+    except Exception:
+        logger.exception('Rendering the copies of %s failed', name)
+        return
+
+    try:
+        # the image may have been replaced while it was rendered
+        updated = Recipe.objects.filter(
+            pk=recipe.pk, image=name
+        ).update(image_sizes=sizes)
+        if updated:
+            # bumped again once the replicas have the sizes
+            bump_user_version(recipe.user_id)
+    finally:
+        # callbacks run in the pool's management thread, don't keep
+        # a connection open there between renders
+        connection.close()
+
+
+def generate_derivatives(recipe):
+    """Render the resized copies of the recipe's image in the background"""
+    name = recipe.image.name
+    targets = [
+        (size, image_format, default_storage.path(
+            derivative_name(name, size, image_format)
+        ))
+        for size in settings.RECIPE_IMAGE_SIZES
+        for image_format in settings.RECIPE_IMAGE_FORMATS
+    ]
+    future = get_executor().submit(
+        render_derivatives, default_storage.path(name), targets
+    )
+    future.add_done_callback(
+        lambda future: _store_sizes(recipe, name, future)
+    )
+
+    return future
+
+
+def reuse_derivatives(recipe):
+    """Use the copies rendered for another recipe with the same image"""
+    # images are stored by content so recipes with the same image
+    # share its name and the copies named after it
+    sizes = Recipe.objects.filter(
+        image=recipe.image.name
+    ).exclude(
+        image_sizes=[]
+    ).values_list('image_sizes', flat=True).first()
+    if not sizes:
+        return False
+
+    Recipe.objects.filter(pk=recipe.pk).update(image_sizes=sizes)
+    recipe.image_sizes = sizes
+
+    return True
+
+
+def derivative_urls(recipe, request=None):
+    """Return the URLs of the rendered copies by size and format"""
+    urls = {}
+    for size in recipe.image_sizes:
+        urls[str(size)] = {}
+        for image_format in settings.RECIPE_IMAGE_FORMATS:
+            url = default_storage.url(
+                derivative_name(recipe.image.name, size, image_format)
+            )
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[str(size)][image_format] = url
+
+    return urls
+
+
+def evict_resized(max_bytes):
+    """Remove the least recently used resized copies above max_bytes"""
+    # returns the size of the copies that are left
+    root = default_storage.path('resized')
+    copies = []
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(('.lock', '.tmp')):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            copies.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in copies)
+    if total <= max_bytes:
+        return total
+
+    copies.sort()
+    for _, size, path in copies:
+        if total <= max_bytes * EVICT_TO:
+            break
+        for remove in (path, f'{path}.lock'):
+            try:
+                os.remove(remove)
+            except FileNotFoundError:
+                pass
+        total -= size
+
+    return total
+
+
+def _count_cached(size):
+    """Add a new copy to the size of the cache, evicting when too large"""
+    global _cache_size, _cache_scanned
+    max_bytes = settings.RECIPE_IMAGE_CACHE_MAX_BYTES
+    with _lock:
+        rescan = (
+            _cache_size is None or
+            time.monotonic() - _cache_scanned > RESCAN_INTERVAL
+        )
+        if not rescan:
+            _cache_size += size
+            rescan = _cache_size > max_bytes
+        if rescan:
+            _cache_size = evict_resized(max_bytes)
+            _cache_scanned = time.monotonic()
+
+
+def _finish_render(name):
+    with _lock:
+        _renders.pop(name, None)
+
+
+def resized_image(name, width, image_format):
+    """Return the storage name of the image resized to the width"""
+    # the copy is rendered on the first request, concurrent requests
+    # for it wait for the same render
+    resized = resized_name(name, width, image_format)
+    path = default_storage.path(resized)
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        pass
+    else:
+        # the modification time orders the copies for eviction
+        if time.time() - mtime > TOUCH_INTERVAL:
+            os.utime(path)
+        return resized
+
+    with _lock:
+        future = _renders.get(resized)
+        rendering = future is None
+        if rendering:
+            future = get_executor().submit(
+                render_width, default_storage.path(name), width,
+                image_format, path
+            )
+            _renders[resized] = future
+    if rendering:
+        future.add_done_callback(lambda _: _finish_render(resized))
+
+    # raises OSError when the image is missing or Pillow can't read it
+    size = future.result(timeout=RENDER_TIMEOUT)
+    if rendering:
+        _count_cached(size)
+
+    return resized
+
+
+def delete_image(name):
+    """Remove an image no recipe uses anymore and its resized copies"""
+    if Recipe.objects.filter(image=name).exists():
+        return
+    try:
+        if time.time() - os.stat(default_storage.path(name)).st_mtime < (
+                RECENTLY_STORED):
+            # left for manage.py prune_images
+            return
+    except FileNotFoundError:
+        pass
+
+    default_storage.delete(name)
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    for directory in ('derivative/recipe', 'resized/recipe'):
+        shutil.rmtree(
+            default_storage.path(f'{directory}/{stem}'), ignore_errors=True
+        )
+
+
+def delete_image_on_commit(name):
+    """Remove the image once the transaction no longer using it commits"""
+    if name and settings.RECIPE_IMAGE_DELETE_ON_COMMIT:
+        transaction.on_commit(lambda: delete_image(name))
@@ -0,0 +1,228 @@
+import concurrent.futures
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import parse_etags, quote_etag
+
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.views import APIView
+
+from core.models import Recipe
+from user.authentication import CachedTokenAuthentication
+
+from recipe.images import resized_image
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# the directories of MEDIA_ROOT that are served, uploads that are
+# still being streamed in are not
+SERVED_DIRECTORIES = ('upload/', 'derivative/')
+
+
+class RangeFile:
+    """Read at most length bytes of a file from its current position"""
+    # FileResponse streams a file until read() returns nothing
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """Return the (start, end) byte positions of a single range header"""
+    # None serves the whole file, multiple ranges are allowed to be
+    # answered that way too
+    match = RANGE_RE.match(header.strip())
+    if match is None or match.groups() == ('', ''):
+        return None
+
+    start, end = match.groups()
+    if start == '':
+        # the last end bytes of the file
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+
+    return start, end
+
+
+def with_headers(response, headers):
+    """Set the headers on the response and return it"""
+    for header, value in headers.items():
+        response[header] = value
+
+    return response
+
+
+class MediaView(APIView):
+    """Serve an uploaded recipe image or one of its resized copies"""
+    authentication_classes = (
+        CachedTokenAuthentication, SessionAuthentication
+    )
+
+    def get_permissions(self):
+        if settings.MEDIA_PRIVATE:
+            return [IsAuthenticated()]
+
+        return [AllowAny()]
+
+    def check_owner(self, request, name):
+        """Raise 404 unless a recipe of the user uses the image"""
+        if name.startswith('derivative/recipe/'):
+            # the copies are in a directory named after the image
+            stem = name.split('/')[2]
+            images = (
+                Q(image__startswith=posixpath.join(
+                    'upload/recipe', stem[:2], stem[2:4], f'{stem}.'
+                )) |
+                Q(image__startswith=f'upload/recipe/{stem}.')
+            )
+        else:
+            images = Q(image=name)
+
+        if not Recipe.objects.filter(images, user=request.user).exists():
+            raise Http404
+
+    def perform_content_negotiation(self, request, force=False):
+        # the response is the file whatever the client accepts
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, path):
+        name = posixpath.normpath(path)
+        if not name.startswith(SERVED_DIRECTORIES):
+            raise Http404
+        if settings.MEDIA_PRIVATE:
+            self.check_owner(request, name)
+
+        # files are never rewritten under the same name, images are
+        # named after their content, so the name identifies the bytes
+        return self.serve(request, name, {
+            'Cache-Control': (
+                f'{"private" if settings.MEDIA_PRIVATE else "public"}, '
+                f'max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable'
+            ),
+        })
+
+    def serve(self, request, name, headers):
+        """Return the media file with the name or hand it to the proxy"""
+        full_path = safe_join(settings.MEDIA_ROOT, name)
+        if not os.path.isfile(full_path):
+            raise Http404
+        size = os.path.getsize(full_path)
+
+        etag = quote_etag(hashlib.md5(f'{name}:{size}'.encode()).hexdigest())
+        headers = {'ETag': etag, **headers}
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return with_headers(HttpResponse(status=304), headers)
+
+        if settings.MEDIA_SERVE_MODE == 'accel':
+            # nginx serves the file from an internal location, the
+            # ranges and sendfile are handled there
+            headers['X-Accel-Redirect'] = (
+                settings.MEDIA_ACCEL_PREFIX + name
+            )
+        elif settings.MEDIA_SERVE_MODE == 'sendfile':
+            headers['X-Sendfile'] = full_path
+        else:
+            return self.file_response(request, full_path, size, headers)
+
+        content_type, _ = mimetypes.guess_type(name)
+        return with_headers(
+            HttpResponse(
+                content_type=content_type or 'application/octet-stream'
+            ),
+            headers
+        )
+
+    def file_response(self, request, full_path, size, headers):
+        """Stream the file or the requested byte range of it"""
+        byte_range = None
+        if_range = request.headers.get('If-Range')
+        if 'Range' in request.headers and if_range in (None, headers['ETag']):
+            byte_range = parse_range(request.headers['Range'], size)
+
+        file = open(full_path, 'rb')
+        if byte_range is None:
+            # the WSGI server can send a whole file with sendfile()
+            response = FileResponse(file)
+        else:
+            start, end = byte_range
+            if start > end:
+                file.close()
+                return with_headers(HttpResponse(status=416), {
+                    'Content-Range': f'bytes */{size}',
+                })
+            file.seek(start)
+            response = FileResponse(RangeFile(file, end - start + 1))
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Type'] = (
+                mimetypes.guess_type(full_path)[0] or
+                'application/octet-stream'
+            )
+
+        response['Accept-Ranges'] = 'bytes'
+
+        return with_headers(response, headers)
+
+
+class ResizedImageView(MediaView):
+    """Serve a recipe's image resized to one of the allowed widths"""
+
+    def get(self, request, pk, width):
+        width = int(width)
+        if width not in settings.RECIPE_IMAGE_WIDTHS:
+            raise Http404
+        recipes = Recipe.objects.filter(pk=pk).exclude(image='')
+        if settings.MEDIA_PRIVATE:
+            recipes = recipes.filter(user=request.user)
+        image = recipes.values_list('image', flat=True).first()
+        if not image:
+            raise Http404
+
+        # WebP for the clients accepting it
+        image_format = (
+            'webp' if 'image/webp' in request.headers.get('Accept', '')
+            else 'jpeg'
+        )
+        try:
+            name = resized_image(image, width, image_format)
+        except concurrent.futures.TimeoutError:
+            return with_headers(
+                HttpResponse(status=503), {'Retry-After': '1'}
+            )
+        except OSError:
+            # the upload is gone or isn't an image Pillow can read
+            raise Http404
+
+        # the URL shows another image once the recipe's is replaced,
+        # clients revalidate it with the ETag of the copy
+        return self.serve(request, name, {
+            'Cache-Control': (
+                f'{"private" if settings.MEDIA_PRIVATE else "public"}, '
+                'no-cache'
+            ),
+            'Vary': 'Accept',
+        })
@@ -0,0 +1,152 @@
+import json
+
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class RecipeAttrCursorPagination(CursorPagination):
+    """Keyset pagination for tags and ingredients"""
+    # the cursor is an opaque, encoded position in the ordering so
+    # every page is a range scan starting from the last row the
+    # client saw instead of an OFFSET that has to skip (and COUNT)
+    # every row before it
+    # id breaks ties between objects that have the same name
+    ordering = ('-name', 'id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        # ?sort=popular lists the objects used by most recipes first,
+        # objects with the same count are in the order they were made
+        if request.query_params.get('sort') == 'popular':
+            return ('-recipe_count', 'id')
+
+        return super().get_ordering(request, queryset, view)
+
+    # CursorPagination only keeps the first ordering field in the
+    # cursor and skips the rows sharing its value with an offset, so
+    # a page of objects with the same name or count has to read every
+    # tie before it. The cursor here holds the value of every field
+    # of the ordering and pages start right after that row.
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor and self._decode_position(self.cursor)
+
+        # previous pages are read backwards from the first row of the
+        # page the client is on
+        ordering = self._ordering(reverse)
+        queryset = queryset.order_by(*ordering)
+        if position is None:
+            results = list(queryset[:self.page_size + 1])
+        else:
+            results = []
+            for condition in self._after(ordering, position):
+                limit = self.page_size + 1 - len(results)
+                results += queryset.filter(condition)[:limit]
+                if len(results) > self.page_size:
+                    break
+        self.page = results[:self.page_size]
+        more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next, self.has_previous = more, position is not None
+        if (self.has_next or self.has_previous) and self.template:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        return self._link(self.page[-1] if self.page else None, False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+
+        return self._link(self.page[0] if self.page else None, True)
+
+    def _ordering(self, reverse):
+        if not reverse:
+            return self.ordering
+
+        return tuple(
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        )
+
+    @staticmethod
+    def _after(ordering, position):
+        """Return the conditions of the rows after a position in order"""
+        # (a, b) after (x, y) is (a = x AND b > y) followed by a > x,
+        # with < for the descending fields. Each one is a range of the
+        # index of the ordering while the OR of them makes the database
+        # filter every tie before the position.
+        conditions = []
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            conditions.insert(0, Q(**equal, **{f'{name}__{lookup}': value}))
+            equal[name] = value
+
+        return conditions
+
+    def _link(self, instance, reverse):
+        if instance is None:
+            # an empty page links back to where it started
+            position = self.cursor.position
+        else:
+            position = json.dumps([
+                getattr(instance, field.lstrip('-'))
+                for field in self.ordering
+            ])
+
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=reverse, position=position)
+        )
+
+    def _decode_position(self, cursor):
+        if cursor.position is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list) or
+                len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position
+
+
+class RecipeCursorPagination(RecipeAttrCursorPagination):
+    """Keyset pagination for recipes"""
+    # newest recipes first, id is unique so no tie breaker is needed
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        # search results are ordered by relevance, the cursor keeps
+        # the rank and id of the last recipe the client saw so
+        # recipes with the same rank aren't skipped with an offset
+        if 'rank' in queryset.query.annotations:
+            return ('-rank', '-id')
+
+        # recipes have no recipe count to sort by popularity
+        return super(RecipeAttrCursorPagination, self).get_ordering(
+            request, queryset, view
+        )
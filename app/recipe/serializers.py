@@ -1,7 +1,14 @@
+from django.db import transaction
+from django.db.models import CharField, Value
+
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
 from core.models import Tag, Ingredient, Recipe
 
+from recipe.cache import bump_user_version
+from recipe.images import derivative_urls
+
 
 class TagSerializer(serializers.ModelSerializer):
     """Serializer for tag objects"""
@@ -21,6 +28,21 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class RecipeAttrBulkSerializer(serializers.Serializer):
+    """Serializer for the names of tags or ingredients to ensure exist"""
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        allow_empty=False,
+        max_length=1000
+    )
+
+
+class AutocompleteSerializer(serializers.Serializer):
+    """Serializer for the query parameters of an autocomplete"""
+    q = serializers.CharField(max_length=255)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Serialize a recipe"""
     # create a PrimaryKeyRelatedField
@@ -34,17 +56,22 @@ class RecipeSerializer(serializers.ModelSerializer):
         many=True,
         queryset=Tag.objects.all()
     )
+    thumbnails = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'title', 'ingredients', 'tags', 'time_minutes',
-            'price', 'link'
+            'price', 'link', 'thumbnails'
         )
         # prevent the user from updating the ID
         # when they may create or edit request
         read_only_fields = ('id',)
 
+    def get_thumbnails(self, obj):
+        """Return the URLs of the resized images by size and format"""
+        return derivative_urls(obj, self.context.get('request'))
+
 
 class RecipeDetailSerializer(RecipeSerializer):
     """Serializer a recipe detail"""
@@ -53,10 +80,153 @@ class RecipeDetailSerializer(RecipeSerializer):
     tags = TagSerializer(many=True, read_only=True)
 
 
+class AnnotatedRecipeDetailSerializer(RecipeSerializer):
+    """Serialize a recipe detail from JSON annotated by the queryset"""
+    # renders exactly like RecipeDetailSerializer but reads the
+    # tags and ingredients that were already built by the database
+    # instead of loading Tag and Ingredient instances
+    ingredients = serializers.JSONField(
+        source='ingredients_json',
+        read_only=True
+    )
+    tags = serializers.JSONField(source='tags_json', read_only=True)
+
+
+class RecipeBulkListSerializer(serializers.ListSerializer):
+    """Validate and create a batch of recipes in a fixed number of queries"""
+    max_length = 1000
+
+    def _owned_ids(self, items):
+        """Return the (field, ID) pairs of the items the user owns"""
+        # one query for every tag and ingredient of the whole batch
+        user = self.context['request'].user
+        ids = {
+            field: {pk for item in items for pk in item.get(field, [])}
+            for field in ('tags', 'ingredients')
+        }
+        tags = Tag.objects.filter(
+            user=user, id__in=ids['tags']
+        ).annotate(
+            field=Value('tags', output_field=CharField())
+        ).values_list('id', 'field')
+        ingredients = Ingredient.objects.filter(
+            user=user, id__in=ids['ingredients']
+        ).annotate(
+            field=Value('ingredients', output_field=CharField())
+        ).values_list('id', 'field')
+
+        return {(field, pk) for pk, field in tags.union(ingredients)}
+
+    def to_internal_value(self, data):
+        if isinstance(data, list) and len(data) > self.max_length:
+            message = f'Ensure there are no more than {self.max_length} items.'
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [message]
+            }, code='max_length')
+
+        if not isinstance(data, list) or not data:
+            # ListSerializer reports input that isn't a list
+            return super().to_internal_value(data)
+
+        # every item is validated, even after an invalid one, so the
+        # response has the errors of each item at its position
+        items = []
+        errors = []
+        for item in data:
+            try:
+                items.append(self.child.run_validation(item))
+                errors.append({})
+            except serializers.ValidationError as exc:
+                items.append({})
+                errors.append(exc.detail)
+
+        owned = self._owned_ids(items)
+        message = serializers.PrimaryKeyRelatedField.default_error_messages[
+            'does_not_exist'
+        ]
+        for item, item_errors in zip(items, errors):
+            for field in ('tags', 'ingredients'):
+                missing = [
+                    message.format(pk_value=pk)
+                    for pk in item.get(field, [])
+                    if (field, pk) not in owned
+                ]
+                if missing:
+                    item_errors[field] = missing
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return items
+
+    def create(self, validated_data):
+        """Create the recipes and their relations with bulk inserts"""
+        recipes = []
+        relations = []
+        for attrs in validated_data:
+            attrs = dict(attrs)
+            relations.append((
+                set(attrs.pop('tags', [])),
+                set(attrs.pop('ingredients', []))
+            ))
+            recipes.append(Recipe(**attrs))
+
+        tag_model = Recipe.tags.through
+        ingredient_model = Recipe.ingredients.through
+        with transaction.atomic():
+            # PostgreSQL returns the primary keys of bulk inserts
+            Recipe.objects.bulk_create(recipes)
+            tag_model.objects.bulk_create([
+                tag_model(recipe_id=recipe.id, tag_id=tag_id)
+                for recipe, (tags, _) in zip(recipes, relations)
+                for tag_id in tags
+            ])
+            ingredient_model.objects.bulk_create([
+                ingredient_model(
+                    recipe_id=recipe.id, ingredient_id=ingredient_id
+                )
+                for recipe, (_, ingredients) in zip(recipes, relations)
+                for ingredient_id in ingredients
+            ])
+            # bulk inserts don't send the signals that invalidate the
+            # cached responses, the recipe counts of the tags and
+            # ingredients are kept by the triggers of migration 0013
+            for user_id in {recipe.user_id for recipe in recipes}:
+                bump_user_version(user_id)
+
+        return list(Recipe.objects.filter(
+            id__in=[recipe.id for recipe in recipes]
+        ).prefetch_related('tags', 'ingredients').order_by('id'))
+
+
+class RecipeBulkSerializer(RecipeSerializer):
+    """Serialize a recipe created in bulk"""
+    # plain lists of IDs, they are checked for the whole batch at
+    # once by RecipeBulkListSerializer instead of one query per ID
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+
+    class Meta(RecipeSerializer.Meta):
+        list_serializer_class = RecipeBulkListSerializer
+
+    def to_representation(self, instance):
+        return RecipeSerializer(instance, context=self.context).data
+
+
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images to recipes"""
+    thumbnails = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'thumbnails')
         read_only_fields = ('id',)
+
+    def get_thumbnails(self, obj):
+        return derivative_urls(obj, self.context.get('request'))
@@ -0,0 +1,34 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe.cache import bump_user_version
+from recipe.images import delete_image_on_commit
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def bump_on_change(sender, instance, **kwargs):
+    """Invalidate the cached responses of the object's owner"""
+    bump_user_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def bump_on_relation_change(sender, instance, action, **kwargs):
+    """Invalidate the cached responses when recipe relations change"""
+    # instance is the recipe, or the tag or ingredient when the
+    # relation is changed from the reverse side
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_user_version(instance.user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_unused_image(sender, instance, **kwargs):
+    """Remove the image of a deleted recipe if no other recipe uses it"""
+    delete_image_on_commit(instance.image.name)
@@ -0,0 +1,125 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Recipe
+
+from recipe.cache import RESPONSE_CACHE, response_stats
+
+
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+METRICS_URL = reverse('recipe:cache-metrics')
+
+
+class ResponseCacheTests(TestCase):
+    """Test the per user list response cache"""
+
+    def setUp(self):
+        caches[RESPONSE_CACHE].clear()
+        response_stats.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_list_is_cached(self):
+        """Test the second identical request is served from the cache"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res1 = self.client.get(TAGS_URL)
+        with self.assertNumQueries(0):
+            res2 = self.client.get(TAGS_URL)
+
+        self.assertEqual(res1['X-Cache'], 'MISS')
+        self.assertEqual(res2['X-Cache'], 'HIT')
+        self.assertEqual(res1.data, res2.data)
+
+    def test_query_param_order_ignored(self):
+        """Test the order of query parameters shares the cache entry"""
+        self.client.get(TAGS_URL, {'assigned_only': 1, 'page_size': 5})
+
+        res = self.client.get(f'{TAGS_URL}?page_size=5&assigned_only=1')
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+
+    def test_change_invalidates_cache(self):
+        """Test creating a tag invalidates the cached list"""
+        self.client.get(TAGS_URL)
+
+        self.client.post(TAGS_URL, {'name': 'Dessert'})
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['results'][0]['name'], 'Dessert')
+
+    def test_relation_change_invalidates_cache(self):
+        """Test adding a tag to a recipe invalidates the cached list"""
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Toast',
+            time_minutes=2,
+            price=1.00
+        )
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        self.client.get(RECIPES_URL)
+
+        recipe.tags.add(tag)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['results'][0]['tags'], [tag.id])
+
+    def test_cache_limited_to_user(self):
+        """Test one user never gets the cached list of another"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(user2)
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['results'], [])
+
+    def test_metrics(self):
+        """Test the hit and miss counts are reported to admins"""
+        self.client.get(TAGS_URL)
+        self.client.get(TAGS_URL)
+        self.client.get(TAGS_URL)
+        admin = get_user_model().objects.create_superuser(
+            'admin@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(admin)
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tag'], {'hits': 2, 'misses': 1})
+
+    def test_version_read_once(self):
+        """Test the ETag and the cache key share one version read"""
+        with patch(
+            'recipe.cache.get_user_version', return_value='1'
+        ) as get_user_version:
+            self.client.get(TAGS_URL)
+
+        get_user_version.assert_called_once_with(self.user.id)
+
+    def test_metrics_admin_only(self):
+        """Test regular users can't read the cache metrics"""
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
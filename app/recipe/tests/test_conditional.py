@@ -0,0 +1,147 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Recipe
+
+from recipe.cache import RESPONSE_CACHE
+
+
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class ConditionalRequestTests(TestCase):
+    """Test ETags and conditional requests"""
+
+    def setUp(self):
+        caches[RESPONSE_CACHE].clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Toast',
+            time_minutes=2,
+            price=1.00
+        )
+
+    def test_list_not_modified(self):
+        """Test a list request with the current ETag returns 304"""
+        res = self.client.get(RECIPES_URL)
+        etag = res['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_weak_etag_not_modified(self):
+        """Test If-None-Match uses the weak comparison"""
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=f'W/{etag}')
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_modified_after_change(self):
+        """Test the ETag changes when the user's data changes"""
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        Tag.objects.create(user=self.user, name='Vegan')
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_list_etag_depends_on_params(self):
+        """Test filtered lists have their own ETag"""
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        res = self.client.get(
+            TAGS_URL, {'assigned_only': 1}, HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_detail_not_modified(self):
+        """Test a detail request with the current ETag returns 304"""
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_update_with_stale_etag_rejected(self):
+        """Test an update based on an old version is rejected"""
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+        self.client.patch(url, {'title': 'French toast'})
+
+        res = self.client.patch(
+            url, {'title': 'Cheese toast'}, HTTP_IF_MATCH=etag
+        )
+
+        self.assertEqual(
+            res.status_code, status.HTTP_412_PRECONDITION_FAILED
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'French toast')
+
+    def test_update_with_current_etag(self):
+        """Test an update based on the current version succeeds"""
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.patch(
+            url, {'title': 'French toast'}, HTTP_IF_MATCH=etag
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(self.client.get(url)['ETag'], res['ETag'])
+
+    def test_update_with_etag_locks_recipe(self):
+        """Test the ETag is checked with the recipe row locked"""
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.patch(
+                url, {'title': 'French toast'}, HTTP_IF_MATCH=etag
+            )
+
+        sql = [query['sql'] for query in queries]
+        locked = [i for i, query in enumerate(sql) if 'FOR UPDATE' in query]
+        updated = [i for i, query in enumerate(sql) if 'UPDATE "' in query]
+        self.assertLess(locked[0], updated[0])
+
+    def test_missing_detail_not_found(self):
+        """Test a missing recipe isn't answered with 304"""
+        res = self.client.get(detail_url(999999), HTTP_IF_NONE_MATCH='*')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_missing_detail_update_not_found(self):
+        """Test updating a missing recipe with If-Match returns 404"""
+        res = self.client.patch(
+            detail_url(999999), {'title': 'Toast'}, HTTP_IF_MATCH='*'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,354 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+from recipe.images import (
+    delete_image,
+    delete_image_on_commit,
+    evict_resized,
+    resized_image,
+)
+
+
+IMAGE_NAME = 'upload/recipe/ab/cd/abcdef.jpg'
+IMAGE_URL = f'/media/{IMAGE_NAME}'
+
+
+class MediaServingTests(TestCase):
+    """Test serving uploaded images"""
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.settings.enable()
+        path = os.path.join(self.media_root.name, IMAGE_NAME)
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as file:
+            file.write(b'0123456789')
+        self.client = APIClient()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def test_serve_file(self):
+        """Test the file is served with long lived cache headers"""
+        res = self.client.get(IMAGE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), b'0123456789')
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+
+        res = self.client.get(IMAGE_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_serve_range(self):
+        """Test serving byte ranges of the file"""
+        res = self.client.get(IMAGE_URL, HTTP_RANGE='bytes=2-5')
+
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(res.streaming_content), b'2345')
+        self.assertEqual(res['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(res['Content-Length'], '4')
+
+        res = self.client.get(IMAGE_URL, HTTP_RANGE='bytes=-3')
+
+        self.assertEqual(b''.join(res.streaming_content), b'789')
+
+        res = self.client.get(IMAGE_URL, HTTP_RANGE='bytes=10-')
+
+        self.assertEqual(
+            res.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(res['Content-Range'], 'bytes */10')
+
+    def test_serve_range_if_range_changed(self):
+        """Test a range for another version returns the whole file"""
+        res = self.client.get(
+            IMAGE_URL, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"old"'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), b'0123456789')
+
+    def test_only_media_directories_served(self):
+        """Test files outside the image directories are not served"""
+        os.makedirs(os.path.join(self.media_root.name, 'tmp'))
+        open(os.path.join(self.media_root.name, 'tmp', 'a.jpg'), 'w').close()
+
+        for url in ('/media/tmp/a.jpg', '/media/upload/../tmp/a.jpg',
+                    '/media/upload/recipe/missing.jpg', '/media/upload/'):
+            res = self.client.get(url)
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(MEDIA_SERVE_MODE='accel')
+    def test_accel_redirect(self):
+        """Test handing the file to the proxy"""
+        res = self.client.get(IMAGE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['X-Accel-Redirect'], f'/internal-media/{IMAGE_NAME}'
+        )
+        self.assertEqual(res.content, b'')
+        self.assertIn('immutable', res['Cache-Control'])
+
+    @override_settings(MEDIA_PRIVATE=True)
+    def test_private_media_owner_only(self):
+        """Test private images are only served to the recipe owner"""
+        owner = get_user_model().objects.create_user('a@gmail.com', 'pass')
+        other = get_user_model().objects.create_user('b@gmail.com', 'pass')
+        Recipe.objects.create(
+            user=owner, title='Toast', time_minutes=2, price=1.00,
+            image=IMAGE_NAME
+        )
+
+        res = self.client.get(IMAGE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.force_authenticate(other)
+        res = self.client.get(IMAGE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(owner)
+        res = self.client.get(IMAGE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Cache-Control'].startswith('private'))
+        b''.join(res.streaming_content)
+
+
+def resized_url(recipe_id, width):
+    """Return the URL of the recipe's image resized to the width"""
+    return f'/media/recipe/{recipe_id}/w/{width}'
+
+
+class ResizedImageTests(TestCase):
+    """Test resizing recipe images on request"""
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.settings.enable()
+        path = os.path.join(self.media_root.name, IMAGE_NAME)
+        os.makedirs(os.path.dirname(path))
+        Image.new('RGB', (1000, 500)).save(path, format='JPEG')
+        user = get_user_model().objects.create_user('a@gmail.com', 'pass')
+        self.recipe = Recipe.objects.create(
+            user=user, title='Toast', time_minutes=2, price=1.00,
+            image=IMAGE_NAME
+        )
+        self.client = APIClient()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def test_resize_image(self):
+        """Test the image is resized to the width and kept"""
+        res = self.client.get(resized_url(self.recipe.id, 320))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('Accept', res['Vary'])
+        self.assertIn('no-cache', res['Cache-Control'])
+        path = os.path.join(
+            self.media_root.name, 'resized/recipe/abcdef/320.jpg'
+        )
+        b''.join(res.streaming_content)
+        with Image.open(path) as image:
+            self.assertEqual(image.size, (320, 160))
+
+        res = self.client.get(
+            resized_url(self.recipe.id, 320), HTTP_IF_NONE_MATCH=res['ETag']
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_resize_image_webp(self):
+        """Test clients accepting WebP get a WebP copy"""
+        res = self.client.get(
+            resized_url(self.recipe.id, 160),
+            HTTP_ACCEPT='image/webp,image/*'
+        )
+
+        self.assertEqual(res['Content-Type'], 'image/webp')
+        b''.join(res.streaming_content)
+
+    def test_resize_width_not_allowed(self):
+        """Test only the configured widths are rendered"""
+        res = self.client.get(resized_url(self.recipe.id, 321))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_resize_recipe_without_image(self):
+        """Test resizing the image of a recipe without one"""
+        Recipe.objects.filter(pk=self.recipe.pk).update(image='')
+
+        res = self.client.get(resized_url(self.recipe.id, 320))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_resize_missing_image(self):
+        """Test a recipe image missing from the storage isn't found"""
+        os.remove(os.path.join(self.media_root.name, IMAGE_NAME))
+
+        res = self.client.get(resized_url(self.recipe.id, 320))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_resize_unreadable_image(self):
+        """Test an image Pillow can't read isn't found"""
+        with open(os.path.join(self.media_root.name, IMAGE_NAME), 'wb') as f:
+            f.write(b'not an image')
+
+        res = self.client.get(resized_url(self.recipe.id, 320))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_resize_timeout(self):
+        """Test a request stops waiting for a render that takes too long"""
+        with patch('recipe.images.get_executor') as get_executor, \
+                patch('recipe.images.RENDER_TIMEOUT', 0.01):
+            future = Future()
+            get_executor.return_value.submit.return_value = future
+            res = self.client.get(resized_url(self.recipe.id, 320))
+        # ends the render for the other tests
+        future.cancel()
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+
+    def test_concurrent_renders_coalesced(self):
+        """Test concurrent requests for a copy render it once"""
+        waiting = threading.Semaphore(0)
+        names = []
+
+        class WaitedFuture(Future):
+            def result(self, timeout=None):
+                waiting.release()
+                return super().result(timeout)
+
+        def request():
+            names.append(resized_image(IMAGE_NAME, 320, 'jpeg'))
+
+        future = WaitedFuture()
+        with patch('recipe.images.get_executor') as get_executor:
+            get_executor.return_value.submit.return_value = future
+            threads = [threading.Thread(target=request) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            # every request waits for the render before it finishes
+            for thread in threads:
+                waiting.acquire()
+            future.set_result(0)
+            for thread in threads:
+                thread.join()
+
+        get_executor.return_value.submit.assert_called_once()
+        self.assertEqual(names, ['resized/recipe/abcdef/320.jpg'] * 3)
+
+    def test_evict_least_recently_used(self):
+        """Test the oldest copies are removed when the cache is full"""
+        directory = os.path.join(self.media_root.name, 'resized/recipe/a')
+        os.makedirs(directory)
+        for age, width in enumerate((160, 320, 480)):
+            path = os.path.join(directory, f'{width}.jpg')
+            with open(path, 'wb') as file:
+                file.write(b'x' * 100)
+            os.utime(path, (1000 - age, 1000 - age))
+
+        total = evict_resized(250)
+
+        self.assertEqual(total, 200)
+        self.assertEqual(
+            sorted(os.listdir(directory)), ['160.jpg', '320.jpg']
+        )
+
+
+class DeleteImageTests(TestCase):
+    """Test removing the image of a recipe once unused"""
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.settings.enable()
+        for name in (IMAGE_NAME, 'derivative/recipe/abcdef/128.jpg'):
+            path = os.path.join(self.media_root.name, name)
+            os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+            os.utime(path, (0, 0))
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media_root.cleanup()
+
+    def _exists(self, name):
+        return os.path.exists(os.path.join(self.media_root.name, name))
+
+    def test_delete_image(self):
+        """Test the image and its copies are removed"""
+        delete_image(IMAGE_NAME)
+
+        self.assertFalse(self._exists(IMAGE_NAME))
+        self.assertFalse(self._exists('derivative/recipe/abcdef'))
+
+    def test_delete_image_still_used(self):
+        """Test an image another recipe uses is kept"""
+        user = get_user_model().objects.create_user('a@gmail.com', 'pass')
+        Recipe.objects.create(
+            user=user, title='Toast', time_minutes=2, price=1.00,
+            image=IMAGE_NAME
+        )
+
+        delete_image(IMAGE_NAME)
+
+        self.assertTrue(self._exists(IMAGE_NAME))
+
+    def test_delete_image_recently_stored(self):
+        """Test an image stored moments ago is left to prune_images"""
+        os.utime(os.path.join(self.media_root.name, IMAGE_NAME))
+
+        delete_image(IMAGE_NAME)
+
+        self.assertTrue(self._exists(IMAGE_NAME))
+
+    @override_settings(RECIPE_IMAGE_DELETE_ON_COMMIT=True)
+    def test_deleted_recipe_image_removed_on_commit(self):
+        """Test deleting a recipe removes its image after the commit"""
+        user = get_user_model().objects.create_user('a@gmail.com', 'pass')
+        recipe = Recipe.objects.create(
+            user=user, title='Toast', time_minutes=2, price=1.00,
+            image=IMAGE_NAME
+        )
+
+        with patch('recipe.images.transaction.on_commit') as on_commit:
+            recipe.delete()
+            on_commit.call_args[0][0]()
+
+        self.assertFalse(self._exists(IMAGE_NAME))
+
+    def test_delete_on_commit_disabled(self):
+        """Test images are only removed when enabled in the settings"""
+        with patch('recipe.images.transaction.on_commit') as on_commit:
+            delete_image_on_commit(IMAGE_NAME)
+
+        on_commit.assert_not_called()
@@ -2,23 +2,32 @@
 # that file after used it
 import tempfile
 import os
+from unittest.mock import patch
 
 # create test images then we can upload to our API
 from PIL import Image
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
 from core.models import Recipe, Tag, Ingredient
 
+from recipe.images import derivative_name, render_derivatives
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe.uploads import ImageUploadHandler, UploadTooLarge
 
 
 RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+FACETS_URL = reverse('recipe:recipe-facets')
 
 
 def image_upload_url(recipe_id):
@@ -94,7 +103,7 @@ class PrivateRecipeApiTests(TestCase):
         # many=True want to return the data as a list and order
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipes_limited_to_user(self):
         """Test retiveving recipes for user"""
@@ -111,8 +120,40 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
+
+    def test_recipes_cursor_paginated(self):
+        """Test walking the recipe list page by page with the cursor"""
+        recipes = [sample_recipe(user=self.user) for _ in range(5)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', res.data)
+        seen = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            seen += [recipe['id'] for recipe in res.data['results']]
+
+        # newest first and every recipe exactly once
+        self.assertEqual(seen, [recipe.id for recipe in reversed(recipes)])
+
+    def test_retrieve_recipes_query_count(self):
+        """Test listing recipes does not run queries per recipe"""
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        for _ in range(5):
+            recipe = sample_recipe(user=self.user)
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+
+        # one query for the recipes and one for each relation
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data['results']), 5)
+        self.assertEqual(res.data['results'][0]['tags'], [tag.id])
 
     def test_view_recipe_detail(self):
         """Test viewing a recipe detail"""
@@ -126,6 +167,29 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeDetailSerializer(recipe)
         self.assertEqual(res.data, serializer.data)
 
+    def test_view_recipe_detail_single_query(self):
+        """Test the recipe detail is read in one query"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user, name='Vegan'))
+        recipe.tags.add(sample_tag(user=self.user, name='Dessert'))
+        recipe.ingredients.add(sample_ingredient(user=self.user))
+
+        url = detail_url(recipe.id)
+        with self.assertNumQueries(1):
+            res = self.client.get(url)
+
+        serializer = RecipeDetailSerializer(recipe)
+        self.assertEqual(res.content, JSONRenderer().render(serializer.data))
+
+    def test_view_recipe_detail_without_relations(self):
+        """Test the recipe detail of a recipe without tags"""
+        recipe = sample_recipe(user=self.user)
+
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.data['tags'], [])
+        self.assertEqual(res.data['ingredients'], [])
+
     def test_create_basic_recipe(self):
         """Test creating recipe"""
         payload = {
@@ -218,6 +282,319 @@ class PrivateRecipeApiTests(TestCase):
         tags = recipe.tags.all()
         self.assertEqual(len(tags), 0)
 
+    def test_filter_recipes_any_not_duplicated(self):
+        """Test a recipe matching several tags is returned once"""
+        recipe = sample_recipe(user=self.user)
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dinner')
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(
+            RECIPES_URL,
+            {'tags': f'{tag1.id},{tag2.id}', 'match': 'any'}
+        )
+
+        self.assertEqual(
+            [item['id'] for item in res.data['results']], [recipe.id]
+        )
+
+    def test_filter_recipes_match_all(self):
+        """Test returning recipes with every one of the tags"""
+        recipe1 = sample_recipe(user=self.user, title='Vegan curry')
+        recipe2 = sample_recipe(user=self.user, title='Vegan salad')
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dinner')
+        ingredient = sample_ingredient(user=self.user, name='Rice')
+        recipe1.tags.add(tag1, tag2)
+        recipe1.ingredients.add(ingredient)
+        recipe2.tags.add(tag1)
+        recipe2.ingredients.add(ingredient)
+
+        res = self.client.get(
+            RECIPES_URL,
+            {'tags': f'{tag1.id},{tag2.id},{tag1.id}', 'match': 'all'}
+        )
+
+        self.assertEqual(
+            [item['id'] for item in res.data['results']], [recipe1.id]
+        )
+
+        res = self.client.get(
+            RECIPES_URL,
+            {'tags': str(tag1.id), 'ingredients': str(ingredient.id),
+             'match': 'all'}
+        )
+
+        self.assertEqual(
+            [item['id'] for item in res.data['results']],
+            [recipe2.id, recipe1.id]
+        )
+
+    def test_filter_recipes_invalid_match(self):
+        """Test filtering with an unknown match mode fails"""
+        res = self.client.get(RECIPES_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeSearchApiTests(TestCase):
+    """Test searching recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _search(self, text, **params):
+        res = self.client.get(RECIPES_URL, {'search': text, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [recipe['id'] for recipe in res.data['results']]
+
+    def test_search_title(self):
+        """Test searching matches stemmed words of the title"""
+        recipe = sample_recipe(user=self.user, title='Baked potatoes')
+        sample_recipe(user=self.user, title='Fish and chips')
+
+        self.assertEqual(self._search('potato'), [recipe.id])
+
+    def test_search_tags_and_ingredients(self):
+        """Test searching matches tag and ingredient names"""
+        recipe1 = sample_recipe(user=self.user, title='Thai curry')
+        recipe1.tags.add(sample_tag(user=self.user, name='Spicy'))
+        recipe2 = sample_recipe(user=self.user, title='Pasta')
+        recipe2.ingredients.add(
+            sample_ingredient(user=self.user, name='Spicy sausage')
+        )
+        sample_recipe(user=self.user, title='Porridge')
+
+        self.assertEqual(
+            set(self._search('spicy')), {recipe1.id, recipe2.id}
+        )
+
+    def test_search_ordered_by_rank(self):
+        """Test title matches come before ingredient matches"""
+        by_ingredient = sample_recipe(user=self.user, title='Omelette')
+        by_ingredient.ingredients.add(
+            sample_ingredient(user=self.user, name='Cheese')
+        )
+        by_title = sample_recipe(user=self.user, title='Cheese toastie')
+
+        self.assertEqual(
+            self._search('cheese'), [by_title.id, by_ingredient.id]
+        )
+
+    def test_search_follows_relation_changes(self):
+        """Test renamed and removed tags update the search"""
+        recipe = sample_recipe(user=self.user, title='Salad')
+        tag = sample_tag(user=self.user, name='Lunch')
+        recipe.tags.add(tag)
+
+        tag.name = 'Dinner'
+        tag.save()
+        self.assertEqual(self._search('dinner'), [recipe.id])
+        self.assertEqual(self._search('lunch'), [])
+
+        recipe.tags.remove(tag)
+        self.assertEqual(self._search('dinner'), [])
+
+    def test_search_limited_to_user(self):
+        """Test searching only returns the user's recipes"""
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        sample_recipe(user=user2, title='Lemon cake')
+
+        self.assertEqual(self._search('lemon'), [])
+
+    def test_search_paginated(self):
+        """Test walking search results with the cursor"""
+        recipes = [
+            sample_recipe(user=self.user, title='Apple ' + 'pie ' * i)
+            for i in range(5)
+        ]
+
+        res = self.client.get(RECIPES_URL, {'search': 'pie', 'page_size': 2})
+        seen = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            seen += [recipe['id'] for recipe in res.data['results']]
+
+        self.assertEqual(sorted(seen), [recipe.id for recipe in recipes[1:]])
+        self.assertEqual(len(seen), 4)
+
+    def test_search_cursor_pages_through_equal_ranks(self):
+        """Test the search cursor keeps its place among equal ranks"""
+        recipes = [
+            sample_recipe(user=self.user, title='Apple pie')
+            for _ in range(5)
+        ]
+
+        res = self.client.get(RECIPES_URL, {'search': 'pie', 'page_size': 2})
+        seen = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            seen += [recipe['id'] for recipe in res.data['results']]
+
+        self.assertEqual(seen, [recipe.id for recipe in reversed(recipes)])
+
+
+class RecipeFacetsApiTests(TestCase):
+    """Test counting recipes per tag and ingredient"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.dinner = sample_tag(user=self.user, name='Dinner')
+        self.rice = sample_ingredient(user=self.user, name='Rice')
+        self.curry = sample_recipe(user=self.user, title='Vegan curry')
+        self.curry.tags.add(self.vegan, self.dinner)
+        self.curry.ingredients.add(self.rice)
+        self.salad = sample_recipe(user=self.user, title='Green salad')
+        self.salad.tags.add(self.vegan)
+        sample_tag(user=self.user, name='Unused')
+
+    def test_facets(self):
+        """Test counting every recipe of the user"""
+        other = get_user_model().objects.create_user('o@gmail.com', 'pass')
+        sample_recipe(user=other).tags.add(sample_tag(user=other))
+
+        with self.assertNumQueries(2):
+            res = self.client.get(FACETS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'tags': [
+                {'id': self.vegan.id, 'name': 'Vegan', 'count': 2},
+                {'id': self.dinner.id, 'name': 'Dinner', 'count': 1},
+            ],
+            'ingredients': [
+                {'id': self.rice.id, 'name': 'Rice', 'count': 1},
+            ],
+        })
+
+    def test_facets_filtered(self):
+        """Test counting only the recipes matching the filters"""
+        res = self.client.get(FACETS_URL, {'search': 'salad'})
+
+        self.assertEqual(res.data, {
+            'tags': [{'id': self.vegan.id, 'name': 'Vegan', 'count': 1}],
+            'ingredients': [],
+        })
+
+        res = self.client.get(FACETS_URL, {'tags': str(self.dinner.id)})
+
+        self.assertEqual(
+            [(tag['name'], tag['count']) for tag in res.data['tags']],
+            [('Dinner', 1), ('Vegan', 1)]
+        )
+
+    def test_facets_cached(self):
+        """Test facets are cached until the user's recipes change"""
+        self.client.get(FACETS_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(FACETS_URL)
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+
+        self.salad.tags.add(self.dinner)
+        res = self.client.get(FACETS_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['tags'][0]['count'], 2)
+        self.assertEqual(res.data['tags'][1]['count'], 2)
+
+
+class BulkRecipeApiTests(TestCase):
+    """Test creating recipes in bulk"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(user=self.user)
+        self.ingredient = sample_ingredient(user=self.user)
+
+    def _payload(self, count):
+        return [
+            {
+                'title': f'Recipe {i}',
+                'time_minutes': 10,
+                'price': '5.00',
+                'tags': [self.tag.id],
+                'ingredients': [self.ingredient.id],
+            }
+            for i in range(count)
+        ]
+
+    def test_bulk_create_recipes(self):
+        """Test creating a list of recipes with their relations"""
+        res = self.client.post(BULK_URL, self._payload(3), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 3)
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(
+            [recipe.title for recipe in recipes],
+            ['Recipe 0', 'Recipe 1', 'Recipe 2']
+        )
+        for recipe in recipes:
+            self.assertEqual(list(recipe.tags.all()), [self.tag])
+            self.assertEqual(
+                list(recipe.ingredients.all()), [self.ingredient]
+            )
+        self.assertEqual(
+            res.data, RecipeSerializer(recipes, many=True).data
+        )
+
+    def test_bulk_create_query_count_constant(self):
+        """Test the number of queries doesn't grow with the batch"""
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(BULK_URL, self._payload(2), format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(BULK_URL, self._payload(20), format='json')
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Recipe.objects.count(), 22)
+
+    def test_bulk_create_reports_item_errors(self):
+        """Test invalid items are reported and nothing is created"""
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        other_tag = sample_tag(user=user2)
+        payload = self._payload(3)
+        payload[0]['tags'] = [other_tag.id]
+        del payload[2]['title']
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data[0])
+        self.assertEqual(res.data[1], {})
+        self.assertIn('title', res.data[2])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_create_requires_list(self):
+        """Test a single object is rejected"""
+        res = self.client.post(BULK_URL, self._payload(1)[0], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
 
 class RecipeImageUploadTests(TestCase):
 
@@ -279,6 +656,107 @@ class RecipeImageUploadTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def _upload(self, image, image_format='JPEG', suffix='.jpg'):
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix=suffix) as ntf:
+            image.save(ntf, format=image_format)
+            ntf.seek(0)
+            return self.client.post(url, {'image': ntf}, format='multipart')
+
+    def test_upload_image_streamed_to_media(self):
+        """Test the upload is moved into place without leftovers"""
+        res = self._upload(Image.new('RGB', (10, 10)))
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(os.path.exists(self.recipe.image.path))
+        self.assertEqual(os.listdir(settings.RECIPE_IMAGE_UPLOAD_DIR), [])
+
+    def test_upload_same_image_shared(self):
+        """Test recipes with the same image share the file and copies"""
+        other = sample_recipe(user=self.user)
+        image = Image.new('RGB', (10, 10))
+        self._upload(image)
+        self.recipe.refresh_from_db()
+        Recipe.objects.filter(pk=self.recipe.pk).update(image_sizes=[128])
+
+        with open(self.recipe.image.path, 'rb') as file:
+            res = self.client.post(
+                image_upload_url(other.id), {'image': file},
+                format='multipart'
+            )
+
+        other.refresh_from_db()
+        self.assertEqual(other.image.name, self.recipe.image.name)
+        self.assertEqual(other.image_sizes, [128])
+        self.assertIn('128', res.data['thumbnails'])
+
+    @override_settings(RECIPE_IMAGE_MAX_BYTES=1000)
+    def test_upload_image_too_large(self):
+        """Test a request larger than the limit is rejected"""
+        res = self._upload(Image.effect_noise((200, 200), 50))
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    @override_settings(RECIPE_IMAGE_MAX_BYTES=1000)
+    def test_upload_image_chunks_too_large(self):
+        """Test streaming stops once the file is larger than the limit"""
+        handler = ImageUploadHandler()
+        handler.new_file('image', 'a.jpg', 'image/jpeg', None)
+        path = handler.file.temporary_file_path()
+        handler.receive_data_chunk(b'x' * 600, 0)
+
+        with self.assertRaises(UploadTooLarge):
+            handler.receive_data_chunk(b'x' * 600, 600)
+
+        self.assertFalse(os.path.exists(path))
+
+    def test_upload_handler_makes_one_file(self):
+        """Test the handler only makes the staged temporary file"""
+        handler = ImageUploadHandler()
+        with patch(
+            'django.core.files.uploadhandler.TemporaryUploadedFile'
+        ) as temporary:
+            handler.new_file('image', 'a.jpg', 'image/jpeg', None)
+        self.addCleanup(handler.file.close)
+
+        temporary.assert_not_called()
+        self.assertEqual(
+            os.path.dirname(handler.file.temporary_file_path()),
+            settings.RECIPE_IMAGE_UPLOAD_DIR
+        )
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100)
+    def test_upload_image_too_many_pixels(self):
+        """Test an image with too many pixels is rejected"""
+        res = self._upload(Image.new('RGB', (20, 20)), 'PNG', '.png')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pixels', res.data['image'][0])
+        self.assertEqual(os.listdir(settings.RECIPE_IMAGE_UPLOAD_DIR), [])
+
+    def test_upload_image_format_not_allowed(self):
+        """Test an image in another format is rejected"""
+        res = self._upload(Image.new('RGB', (10, 10)), 'BMP', '.bmp')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_image_clears_thumbnails(self):
+        """Test the thumbnails of a replaced image are not listed"""
+        Recipe.objects.filter(pk=self.recipe.pk).update(image_sizes=[128])
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['thumbnails'], {})
+        self.assertEqual(self.recipe.image_sizes, [])
+
     def test_filter_recipes_by_tags(self):
         """Test returning recipes with specific tags"""
         recipe1 = sample_recipe(user=self.user, title='Thai vefetable curry')
@@ -297,9 +775,9 @@ class RecipeImageUploadTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
 
     def test_filter_recipes_by_ingredients(self):
         """Test returning recipes with specific ingredients"""
@@ -319,6 +797,59 @@ class RecipeImageUploadTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
+
+
+class RecipeThumbnailTests(TestCase):
+    """Test rendering and listing the resized copies of recipe images"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+
+    def test_render_thumbnails(self):
+        """Test rendering the resized copies of an image"""
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'source.jpg')
+            Image.new('RGB', (2000, 1000)).save(source, format='JPEG')
+            targets = [
+                (size, image_format, os.path.join(
+                    directory, derivative_name('a.jpg', size, image_format)
+                ))
+                for size in (128, 512)
+                for image_format in ('webp', 'jpeg')
+            ]
+
+            sizes = render_derivatives(source, targets)
+
+            self.assertEqual(sizes, [128, 512])
+            for size, image_format, path in targets:
+                with Image.open(path) as image:
+                    self.assertEqual(image.format, image_format.upper())
+                    self.assertEqual(image.size, (size, size // 2))
+
+    def test_thumbnail_urls(self):
+        """Test the recipe lists the URLs of its rendered thumbnails"""
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            image='upload/recipe/abc.jpg', image_sizes=[128, 512]
+        )
+
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(
+            res.data['thumbnails']['128'],
+            {
+                'webp': 'http://testserver/media/'
+                        'derivative/recipe/abc/128.webp',
+                'jpeg': 'http://testserver/media/'
+                        'derivative/recipe/abc/128.jpg',
+            }
+        )
+        self.assertEqual(list(res.data['thumbnails']), ['128', '512'])
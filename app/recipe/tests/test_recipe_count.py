@@ -0,0 +1,127 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+class RecipeCountTests(TestCase):
+    """Test the recipe counts of tags and ingredients"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.dinner = Tag.objects.create(user=self.user, name='Dinner')
+        self.rice = Ingredient.objects.create(user=self.user, name='Rice')
+        self.curry = self._recipe('Curry')
+        self.salad = self._recipe('Salad')
+
+    def _recipe(self, title):
+        return Recipe.objects.create(
+            user=self.user, title=title, time_minutes=5, price=5.00
+        )
+
+    def assertCounts(self, *expected):
+        self.assertEqual(
+            [
+                obj.__class__.objects.get(pk=obj.pk).recipe_count
+                for obj, _ in expected
+            ],
+            [count for _, count in expected]
+        )
+
+    def test_add_and_remove(self):
+        """Test adding and removing relations from both sides"""
+        self.curry.tags.add(self.vegan, self.dinner)
+        self.curry.tags.add(self.vegan)
+        self.vegan.recipe_set.add(self.salad)
+        self.curry.ingredients.add(self.rice)
+
+        self.assertCounts((self.vegan, 2), (self.dinner, 1), (self.rice, 1))
+
+        self.curry.tags.remove(self.vegan, self.dinner)
+        self.dinner.recipe_set.remove(self.salad)
+
+        self.assertCounts((self.vegan, 1), (self.dinner, 0), (self.rice, 1))
+
+    def test_clear_and_set(self):
+        """Test clearing and replacing relations"""
+        self.curry.tags.add(self.vegan, self.dinner)
+        self.salad.tags.add(self.vegan)
+
+        self.vegan.recipe_set.clear()
+        self.curry.tags.set([self.vegan])
+
+        self.assertCounts((self.vegan, 1), (self.dinner, 0))
+
+        self.curry.tags.clear()
+
+        self.assertCounts((self.vegan, 0), (self.dinner, 0))
+
+    def test_recipe_deleted(self):
+        """Test deleting recipes decrements the counts"""
+        self.curry.tags.add(self.vegan, self.dinner)
+        self.salad.tags.add(self.vegan)
+        self.salad.ingredients.add(self.rice)
+
+        self.curry.delete()
+        Recipe.objects.filter(pk=self.salad.pk).delete()
+
+        self.assertCounts((self.vegan, 0), (self.dinner, 0), (self.rice, 0))
+
+    def test_save_keeps_count(self):
+        """Test saving a tag read before a change keeps the new count"""
+        self.curry.tags.add(self.vegan)
+
+        self.vegan.name = 'Plant based'
+        self.vegan.save()
+
+        self.assertCounts((self.vegan, 1))
+
+    def test_bulk_create(self):
+        """Test bulk created recipes are counted"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        payload = [
+            {
+                'title': f'Recipe {i}',
+                'time_minutes': 5,
+                'price': '5.00',
+                'tags': [self.vegan.id, self.dinner.id][:i + 1],
+                'ingredients': [self.rice.id],
+            }
+            for i in range(2)
+        ]
+
+        client.post(BULK_URL, payload, format='json')
+
+        self.assertCounts((self.vegan, 2), (self.dinner, 1), (self.rice, 2))
+
+    def test_only_changed_rows_counted(self):
+        """Test relations that already exist or are gone aren't counted"""
+        through = Recipe.tags.through
+        self.curry.tags.add(self.vegan)
+
+        # what a concurrent add of the same tag runs into
+        through.objects.bulk_create(
+            [
+                through(recipe_id=self.curry.id, tag_id=self.vegan.id),
+                through(recipe_id=self.salad.id, tag_id=self.vegan.id),
+            ],
+            ignore_conflicts=True
+        )
+
+        self.assertCounts((self.vegan, 2))
+
+        through.objects.filter(recipe=self.curry).delete()
+        through.objects.filter(recipe=self.curry).delete()
+
+        self.assertCounts((self.vegan, 1))
@@ -11,6 +11,8 @@ from recipe.serializers import TagSerializer
 
 
 TAGS_URL = reverse('recipe:tag-list')
+TAGS_BULK_URL = reverse('recipe:tag-bulk')
+TAGS_AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 
 class PublicTagsApiTests(TestCase):
@@ -58,7 +60,7 @@ class PrivateTagsApiTests(TestCase):
         # and then we expect that to equal the serializer.data
         # that we passed in so result should be same
         # and revers order list of all tags orders by name
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """Test that tags returned are for the authenticated user"""
@@ -87,14 +89,14 @@ class PrivateTagsApiTests(TestCase):
         # if there's one return then that's what we expect
         # because we only created one tag assigned to the
         # authenticated user
-        # len(res.data) the length of the array that was return
-        # in the request
-        self.assertEqual(len(res.data), 1)
+        # len(res.data['results']) the length of the array that was
+        # return in the request
+        self.assertEqual(len(res.data['results']), 1)
         # test the name of the tag returned in the one response
         # is the tag that we create and assign to the user
-        # res.data[0] take the first element of the data response
+        # res.data['results'][0] take the first element of the response
         # and get the name and compare that to tag.name
-        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
 
     def test_create_tag_successful(self):
         """Test creating a new tag"""
@@ -115,6 +117,108 @@ class PrivateTagsApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_tag_duplicate_name(self):
+        """Test a tag name can't be used twice in any case"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(TAGS_URL, {'name': 'VEGAN'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_create_tag_same_name_other_user(self):
+        """Test another user's tag name can be used"""
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        Tag.objects.create(user=user2, name='Vegan')
+
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_bulk_ensure_tags(self):
+        """Test ensuring tags exist creates only the missing ones"""
+        existing = Tag.objects.create(user=self.user, name='Vegan')
+        payload = {'names': ['vegan', 'Dessert', 'Quick', 'dessert']}
+
+        with self.assertNumQueries(2):
+            res = self.client.post(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in res.data],
+            ['Vegan', 'Dessert', 'Quick', 'Dessert']
+        )
+        self.assertEqual(res.data[0]['id'], existing.id)
+        self.assertEqual(res.data[1]['id'], res.data[3]['id'])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 3)
+
+    def test_bulk_ensure_tags_lowered_by_database(self):
+        """Test names Python lowers differently from the database"""
+        payload = {'names': ['İstanbul', 'Straße', 'İstanbul']}
+
+        res = self.client.post(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in res.data],
+            ['İstanbul', 'Straße', 'İstanbul']
+        )
+
+    def test_bulk_ensure_tags_invalid(self):
+        """Test ensuring an empty list of tags fails"""
+        res = self.client.post(TAGS_BULK_URL, {'names': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_tags(self):
+        """Test completing a prefix or a misspelled tag name"""
+        Tag.objects.create(user=self.user, name='Chinese')
+        chili = Tag.objects.create(user=self.user, name='Chili')
+        chicken = Tag.objects.create(user=self.user, name='Chicken')
+        Tag.objects.create(user=self.user, name='Dessert')
+        other = get_user_model().objects.create_user('o@gmail.com', 'pass')
+        Tag.objects.create(user=other, name='Chicken')
+        recipe = Recipe.objects.create(
+            title='Curry', time_minutes=10, price=5.00, user=self.user
+        )
+        recipe.tags.add(chili)
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'CHI'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # the same similarity to the prefix, the used tag comes first
+        self.assertEqual(
+            [tag['name'] for tag in res.data],
+            ['Chili', 'Chicken', 'Chinese']
+        )
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'chiken'})
+
+        self.assertEqual(res.data[0], TagSerializer(chicken).data)
+        self.assertNotIn('Dessert', [tag['name'] for tag in res.data])
+
+    def test_autocomplete_tags_limit(self):
+        """Test the number of completions is limited"""
+        for name in ('Pasta', 'Pastry', 'Paste'):
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'pas', 'limit': 2})
+
+        self.assertEqual(len(res.data), 2)
+
+    def test_autocomplete_tags_invalid(self):
+        """Test completing without text or a too large limit fails"""
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'a', 'limit': 51})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_retrieve_tags_assigned_to_recipes(self):
         """Test filtering tags by those assigned to recipes"""
         tag1 = Tag.objects.create(user=self.user, name='Breakfast')
@@ -134,8 +238,8 @@ class PrivateTagsApiTests(TestCase):
 
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     def test_retrieve_tags_assigned_unique(self):
         """Test filtering tags by assigned returns unique items"""
@@ -158,4 +262,64 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_retrieve_tags_cursor_paginated_with_filter(self):
+        """Test the cursor keeps the assigned_only filter across pages"""
+        recipe = Recipe.objects.create(
+            title='Toast',
+            time_minutes=2,
+            price=1.00,
+            user=self.user
+        )
+        for name in ('Breakfast', 'Brunch', 'Snack'):
+            recipe.tags.add(Tag.objects.create(user=self.user, name=name))
+        Tag.objects.create(user=self.user, name='Unused')
+
+        res = self.client.get(TAGS_URL, {'assigned_only': 1, 'page_size': 2})
+        names = [tag['name'] for tag in res.data['results']]
+        res = self.client.get(res.data['next'])
+        names += [tag['name'] for tag in res.data['results']]
+
+        self.assertIsNone(res.data['next'])
+        self.assertEqual(names, ['Snack', 'Brunch', 'Breakfast'])
+
+    def test_retrieve_tags_sorted_by_popularity(self):
+        """Test listing the tags used by most recipes first"""
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('Breakfast', 'Lunch', 'Dinner')
+        ]
+        for count in range(3):
+            recipe = Recipe.objects.create(
+                title=f'Recipe {count}',
+                time_minutes=5,
+                price=3.00,
+                user=self.user
+            )
+            recipe.tags.add(*tags[count:])
+
+        res = self.client.get(TAGS_URL, {'sort': 'popular', 'page_size': 2})
+        names = [tag['name'] for tag in res.data['results']]
+        res = self.client.get(res.data['next'])
+        names += [tag['name'] for tag in res.data['results']]
+
+        self.assertEqual(names, ['Dinner', 'Lunch', 'Breakfast'])
+
+    def test_popular_cursor_pages_through_ties(self):
+        """Test the popular cursor keeps its place among equal counts"""
+        tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(5)
+        ]
+
+        res = self.client.get(TAGS_URL, {'sort': 'popular', 'page_size': 2})
+        pages = [[tag['id'] for tag in res.data['results']]]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            pages.append([tag['id'] for tag in res.data['results']])
+        res = self.client.get(res.data['previous'])
+
+        ids = [tag.id for tag in tags]
+        self.assertEqual(pages, [ids[:2], ids[2:4], ids[4:]])
+        self.assertEqual([tag['id'] for tag in res.data['results']], ids[2:4])
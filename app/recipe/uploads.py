@@ -0,0 +1,114 @@
+import os
+import tempfile
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.uploadedfile import (
+    TemporaryUploadedFile,
+    UploadedFile,
+)
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+
+from rest_framework import exceptions, status
+
+
+# room for the multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD = 16 * 2 ** 10
+
+# formats accepted as recipe images, as named by Pillow
+IMAGE_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+
+class UploadTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'The uploaded file is too large.'
+    default_code = 'too_large'
+
+
+class StagedUploadedFile(TemporaryUploadedFile):
+    """A temporary upload on the same file system as the media files"""
+
+    def __init__(self, name, content_type, size, charset,
+                 content_type_extra=None):
+        # FileSystemStorage moves a file with a temporary path into
+        # place, on the same file system that is a rename, not a copy
+        os.makedirs(settings.RECIPE_IMAGE_UPLOAD_DIR, exist_ok=True)
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(
+            suffix='.upload' + ext, dir=settings.RECIPE_IMAGE_UPLOAD_DIR
+        )
+        UploadedFile.__init__(
+            self, file, name, content_type, size, charset,
+            content_type_extra
+        )
+
+
+def check_image_header(file):
+    """Validate the format and dimensions read from the image header"""
+    try:
+        # Image.open only reads the header, the pixels are decoded
+        # when they are first used
+        with Image.open(file) as image:
+            image_format = image.format
+            width, height = image.size
+    except (OSError, Image.DecompressionBombError):
+        image_format = None
+    finally:
+        file.seek(0)
+
+    if image_format not in IMAGE_FORMATS:
+        raise exceptions.ValidationError({'image': [
+            'Upload a JPEG, PNG or WebP image.'
+        ]})
+    if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+        raise exceptions.ValidationError({'image': [
+            f'Ensure the image has at most '
+            f'{settings.RECIPE_IMAGE_MAX_PIXELS} pixels '
+            f'(it has {width * height}).'
+        ]})
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Stream an uploaded image to disk with byte and pixel limits"""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        # the declared length is checked before any of the body is read
+        max_length = settings.RECIPE_IMAGE_MAX_BYTES + MULTIPART_OVERHEAD
+        if content_length > max_length:
+            raise UploadTooLarge()
+
+    def new_file(self, *args, **kwargs):
+        # skip TemporaryFileUploadHandler.new_file, it would make a
+        # temporary file of its own that is replaced right away
+        FileUploadHandler.new_file(self, *args, **kwargs)
+        self.file = StagedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset,
+            self.content_type_extra
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        # the length of a chunked request body isn't known up front
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.file.close()
+            raise UploadTooLarge()
+
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        try:
+            check_image_header(file)
+        except exceptions.ValidationError:
+            file.close()
+            raise
+
+        return file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
+from core.async_views import async_read_patterns
+
 from . import views
 
 # the DefaultRouter is a feature of the Djando rest_framework
@@ -14,6 +17,10 @@ routers.register('tags', views.TagViewSet)
 routers.register('ingredients', views.IngredientViewSet)
 routers.register('recipes', views.RecipeViewSet)
 
+router_urls = routers.urls
+if settings.ASYNC_VIEWS:
+    router_urls = async_read_patterns(router_urls)
+
 app_name = 'recipe'
 
 urlpatterns = [
@@ -21,5 +28,15 @@ urlpatterns = [
     # then will be include in the URL patterns
     # and if we add any more viewset they automatically
     # have all of the URLs generated
-    path('', include(routers.urls))
+    path('', include(router_urls)),
+    path(
+        'cache-metrics/',
+        views.ResponseCacheMetricsView.as_view(),
+        name='cache-metrics'
+    ),
+    path(
+        'database-metrics/',
+        views.DatabaseMetricsView.as_view(),
+        name='database-metrics'
+    ),
 ]
@@ -1,20 +1,51 @@
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Count,
+    F,
+    JSONField,
+    OuterRef,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce
+
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.views import APIView
 
+from core.db.pool import get_metrics as get_database_metrics
 from core.models import Tag, Ingredient, Recipe
+from user.authentication import CachedTokenAuthentication
 
 from . import serializers
+from .cache import CachedListMixin, bump_user_version, get_metrics
+from .conditional import ConditionalRequestMixin
+from .expressions import JSONBAgg, JSONBBuildObject
+from .images import (
+    delete_image_on_commit,
+    generate_derivatives,
+    reuse_derivatives,
+)
+from .pagination import RecipeAttrCursorPagination, RecipeCursorPagination
+from .uploads import ImageUploadHandler
+
+
+# the query parameters that narrow down the listed recipes
+FILTER_PARAMS = ('tags', 'ingredients', 'search')
 
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrViewSet(ConditionalRequestMixin,
+                            CachedListMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     """Base viewset for user owend reipe attributes"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeAttrCursorPagination
 
     def get_queryset(self):
         """Return objects for the current authenicated user only"""
@@ -24,15 +55,79 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
         )
         queryset = self.queryset
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            # the stored count replaces a join through every relation
+            # and the DISTINCT that removed the duplicates it made
+            queryset = queryset.filter(recipe_count__gt=0)
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by('-name')
 
     def perform_create(self, serializer):
         """Create a new object"""
-        serializer.save(user=self.request.user)
+        # names are unique per user regardless of case, the database
+        # checks that so two concurrent requests can't both succeed
+        try:
+            with transaction.atomic():
+                serializer.save(user=self.request.user)
+        except IntegrityError:
+            raise ValidationError(
+                {'name': ['An object with this name already exists.']}
+            )
+
+    @action(methods=['GET'], detail=False)
+    def autocomplete(self, request):
+        """Return the objects best matching a partly typed name"""
+        params = serializers.AutocompleteSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        # prefix and fuzzy matches, most similar and most used first
+        objects = self.queryset.filter(
+            user=request.user
+        ).autocomplete(
+            params.validated_data['q']
+        )[:params.validated_data['limit']]
+        serializer = self.get_serializer(objects, many=True)
+
+        return Response(serializer.data)
+
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """Make sure objects with the given names exist"""
+        serializer = serializers.RecipeAttrBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        names = serializer.validated_data['names']
+
+        model = self.queryset.model
+        # INSERT ... ON CONFLICT DO NOTHING so existing names and
+        # concurrent requests creating the same name are not errors,
+        # the first spelling of a name given more than once in
+        # different cases wins
+        model.objects.bulk_create(
+            [
+                model(user=request.user, name=name)
+                for name in dict.fromkeys(names)
+            ],
+            ignore_conflicts=True
+        )
+        # bulk_create doesn't send the signals that invalidate the
+        # cached responses
+        bump_user_version(request.user.id)
+
+        # the names are matched by the database's lower() like the
+        # unique index, Python's str.lower() differs for some letters
+        # and locales
+        objects = model.objects.raw(
+            'SELECT o.* FROM unnest(%s::text[]) '
+            'WITH ORDINALITY AS given(name, position) '
+            f'JOIN {model._meta.db_table} o '
+            'ON lower(o.name) = lower(given.name) AND o.user_id = %s '
+            'ORDER BY given.position',
+            [names, request.user.id]
+        )
+        serializer = self.get_serializer(list(objects), many=True)
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
@@ -85,22 +180,44 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     #     serializer.save(user=self.request.user)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalRequestMixin,
+                    CachedListMixin,
+                    viewsets.ModelViewSet):
     """Manage recipes in the database"""
     # ModelViewSet allow update create view details
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeCursorPagination
 
     def _params_to_ints(self, qs):
         """Convert a list of string IDs to a list of integers"""
         return [int(str_id) for str_id in qs.split(',')]
 
+    def _related_json(self, model):
+        """Return a subquery building the JSON list of related objects"""
+        # builds the same [{"id": ..., "name": ...}] list that the
+        # nested TagSerializer or IngredientSerializer would render
+        # but inside the recipe query so no extra round trip is needed
+        rows = model.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            data=JSONBAgg(JSONBBuildObject('id', 'name'), ordering='id')
+        ).values('data')
+
+        return Coalesce(
+            Subquery(rows), Value('[]'), output_field=JSONField()
+        )
+
     def get_queryset(self):
         """Retrieve the recipes for the authenticated user"""
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        search = self.request.query_params.get('search')
+        match = self.request.query_params.get('match', 'any')
+        if match not in ('all', 'any'):
+            raise ValidationError({'match': ['Must be "all" or "any".']})
         # we do this is because we don't want to be reassigning
         # our query set with the filtered option we want to
         # actually reference queryset apply the filter and then
@@ -111,19 +228,41 @@ class RecipeViewSet(viewsets.ModelViewSet):
             # __ Django syntax for filtering on foreign key objects
             # tags field in our queryset in a recipe query set
             # and that has a foreign key to the tags table wihich
-            # has an ID, __in return all of the tags where the ID
-            # is in this list that we provide
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            # has an ID, recipes with any (or with match=all, every)
+            # one of the tags in this list that we provide
+            queryset = queryset.related_to(
+                'tags', tag_ids, match_all=match == 'all'
+            )
         if ingredients:
             ingredients_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredients_ids)
+            queryset = queryset.related_to(
+                'ingredients', ingredients_ids, match_all=match == 'all'
+            )
 
-        return queryset.filter(user=self.request.user)
+        if search:
+            # matches the title, tag and ingredient names ordered by
+            # relevance using the full text index
+            queryset = queryset.search(search)
+
+        queryset = queryset.filter(user=self.request.user)
+        if self.action == 'retrieve':
+            # the detail is read in a single query with the nested
+            # tags and ingredients aggregated by the database
+            return queryset.annotate(
+                tags_json=self._related_json(Tag),
+                ingredients_json=self._related_json(Ingredient)
+            )
+
+        # fetch the tag and ingredient IDs of every recipe on the page
+        # in one query per relation instead of two queries per recipe
+        return queryset.prefetch_related('tags', 'ingredients')
 
     def get_serializer_class(self):
         """Return appropriate serializer class"""
         if self.action == 'retrieve':
-            return serializers.RecipeDetailSerializer
+            return serializers.AnnotatedRecipeDetailSerializer
+        elif self.action == 'bulk':
+            return serializers.RecipeBulkSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
 
@@ -133,6 +272,52 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Create a new recipe"""
         serializer.save(user=self.request.user)
 
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """Create a list of recipes in one transaction"""
+        serializer = self.get_serializer(data=request.data, many=True)
+        # the errors are a list with the errors of each recipe
+        # at its position and nothing is saved if any is invalid
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def _facet_counts(self, model, recipes):
+        """Return the number of recipes per tag or ingredient"""
+        objects = model.objects.filter(user=self.request.user)
+        # without filters the stored counts are used, otherwise the
+        # relations of the filtered recipes are counted, objects without
+        # any matching recipe are left out in both cases
+        if recipes is None:
+            objects = objects.filter(recipe_count__gt=0).values(
+                'id', 'name', count=F('recipe_count')
+            )
+        else:
+            objects = objects.filter(recipe__in=recipes).values(
+                'id', 'name'
+            ).annotate(count=Count('recipe'))
+
+        return list(objects.order_by('-count', 'name'))
+
+    def _facets(self):
+        recipes = None
+        params = self.request.query_params
+        if any(params.get(name) for name in FILTER_PARAMS):
+            recipes = self.get_queryset().order_by().values('pk')
+
+        return Response({
+            'tags': self._facet_counts(Tag, recipes),
+            'ingredients': self._facet_counts(Ingredient, recipes),
+        })
+
+    @action(methods=['GET'], detail=False)
+    def facets(self, request):
+        """Count the filtered recipes per tag and ingredient"""
+        return self.cached_response(
+            request, f'{self.basename}-facets', self._facets
+        )
+
     # Custom actions
     # allow user to POST an image to recipe
     # detail is a specific recipe so only be able to upload images
@@ -143,13 +328,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def upload_image(self, request, pk=None):
         """Upload an image to a recipe"""
         recipe = self.get_object()
+        # replaces the default handlers before the body is parsed
+        # so the image is streamed to disk with limits instead of being
+        # buffered in memory and handed to Pillow as a whole
+        request.upload_handlers = [ImageUploadHandler(request)]
         serializer = self.get_serializer(
             recipe,
             data=request.data
         )
 
         if serializer.is_valid():
-            serializer.save()
+            # the copies of the previous image are no longer listed,
+            # the new ones are rendered by a worker process after the
+            # upload is committed instead of before responding
+            previous = recipe.image.name
+            recipe = serializer.save(image_sizes=[])
+            if not reuse_derivatives(recipe):
+                transaction.on_commit(lambda: generate_derivatives(recipe))
+            if previous != recipe.image.name:
+                delete_image_on_commit(previous)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -159,3 +356,22 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+
+class ResponseCacheMetricsView(APIView):
+    """Report the hits and misses of the list response cache"""
+    # counted by each worker, like the database metrics
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(get_metrics(
+            ('tag', 'ingredient', 'recipe', 'recipe-facets')
+        ))
+
+
+class DatabaseMetricsView(APIView):
+    """Report the connection churn and pool use of this process"""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(get_database_metrics())
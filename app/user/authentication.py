@@ -0,0 +1,114 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from rest_framework.authentication import TokenAuthentication
+
+
+# name of the cache in settings.CACHES holding authenticated tokens
+TOKEN_CACHE = 'auth_tokens'
+# name of the cache in settings.CACHES holding the user versions, it
+# has to be shared by every worker
+USER_VERSION_CACHE = 'auth_versions'
+
+# methods authenticated from the token cache
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def token_cache_key(key):
+    """Return the cache key for a token key"""
+    return f'token:{key}'
+
+
+def _version_key(user_id):
+    return f'user:{user_id}'
+
+
+def _checked_version_key(user_id):
+    return f'version:{user_id}'
+
+
+def get_user_version(user_id):
+    """Return the current version of the user's credentials"""
+    cache = caches[USER_VERSION_CACHE]
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(_version_key(user_id), version, timeout=None):
+            version = cache.get(_version_key(user_id), version)
+
+    return version
+
+
+def checked_user_version(user_id):
+    """Return the user's version read by the worker in the last
+    AUTH_VERSION_CHECK_INTERVAL seconds"""
+    # the shared cache may be the database, remembering the version
+    # in the worker's cache keeps cached tokens free of queries
+    cache = caches[TOKEN_CACHE]
+    version = cache.get(_checked_version_key(user_id))
+    if version is None:
+        version = get_user_version(user_id)
+        cache.set(
+            _checked_version_key(user_id), version,
+            settings.AUTH_VERSION_CHECK_INTERVAL
+        )
+
+    return version
+
+
+def _set_new_version(user_id):
+    version = uuid.uuid4().hex
+    caches[USER_VERSION_CACHE].set(
+        _version_key(user_id), version, timeout=None
+    )
+    # the worker making the change sees it right away
+    caches[TOKEN_CACHE].set(
+        _checked_version_key(user_id), version,
+        settings.AUTH_VERSION_CHECK_INTERVAL
+    )
+
+
+def invalidate_user(user_id):
+    """Stop every worker from using its cached tokens of the user"""
+    _set_new_version(user_id)
+    # bump again once the change is committed, a request that read
+    # the new version before the commit may have cached the old user
+    transaction.on_commit(lambda: _set_new_version(user_id))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that caches the token and its user"""
+    # TokenAuthentication joins the token and the user tables on every
+    # request. Reads use the token and user cached by the worker as
+    # long as the user's version in the shared cache is the one they
+    # were cached with, the signals in user.signals change it when a
+    # token is deleted or its user is saved. Each worker checks the
+    # version at most once per AUTH_VERSION_CHECK_INTERVAL. Writes
+    # always load both from the database so they never act on a stale
+    # user.
+
+    def authenticate(self, request):
+        self.use_cache = request.method in SAFE_METHODS
+
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        cache = caches[TOKEN_CACHE]
+        if self.use_cache:
+            cached = cache.get(token_cache_key(key))
+            if cached is not None:
+                token, version = cached
+                if version == checked_user_version(token.user_id):
+                    return (token.user, token)
+
+        # only tokens of active users get here so failed attempts
+        # are never cached
+        user, token = super().authenticate_credentials(key)
+        cache.set(
+            token_cache_key(key), (token, checked_user_version(user.pk))
+        )
+
+        return (user, token)
@@ -50,14 +50,19 @@ class UserSerializer(serializers.ModelSerializer):
         # use None here is because with the pop function
         # must provide a default value
         password = validate_data.pop('password', None)
-        # super() will call the ModelSerializer update function
-        user = super().update(instance, validate_data)
+        for attr, value in validate_data.items():
+            setattr(instance, attr, value)
+        fields = list(validate_data)
 
         if password:
-            user.set_password(password)
-            user.save()
+            instance.set_password(password)
+            fields.append('password')
 
-        return user
+        # only save the fields that were sent so a change of the others
+        # made meanwhile, like is_active in the admin, isn't undone
+        instance.save(update_fields=fields)
+
+        return instance
 
 # this function is called when we validate our serializer
 # validation is checking the input are all correct
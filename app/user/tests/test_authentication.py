@@ -0,0 +1,179 @@
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user import authentication
+from user.authentication import (
+    TOKEN_CACHE, USER_VERSION_CACHE, invalidate_user, token_cache_key
+)
+
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating with cached tokens"""
+
+    def setUp(self):
+        caches[TOKEN_CACHE].clear()
+        caches[USER_VERSION_CACHE].clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass',
+            name='test'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_token_runs_no_queries(self):
+        """Test a repeated request doesn't query the token or user"""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_invalid_token_not_cached(self):
+        """Test that a failed authentication is not cached"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIsNone(caches[TOKEN_CACHE].get(token_cache_key('invalid')))
+
+    def test_deleted_token_rejected(self):
+        """Test that a deleted token stops working immediately"""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_changed_user_reloaded(self):
+        """Test a user changed by another worker isn't served cached"""
+        self.client.get(ME_URL)
+
+        get_user_model().objects.filter(pk=self.user.pk).update(name='new')
+        # what the signal of the other worker does
+        invalidate_user(self.user.pk)
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'new')
+
+    def _change_in_other_worker(self):
+        """Change the user the way a signal of another worker does"""
+        get_user_model().objects.filter(pk=self.user.pk).update(name='new')
+        caches[USER_VERSION_CACHE].set(
+            authentication._version_key(self.user.pk), 'other', None
+        )
+
+    def test_version_checked_once_per_interval(self):
+        """Test the shared version isn't read again within the interval"""
+        self.client.get(ME_URL)
+
+        self._change_in_other_worker()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'test')
+
+    @override_settings(AUTH_VERSION_CHECK_INTERVAL=0)
+    def test_version_checked_after_interval(self):
+        """Test a change of another worker is seen after the interval"""
+        self.client.get(ME_URL)
+
+        self._change_in_other_worker()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'new')
+
+    def test_write_authenticated_from_database(self):
+        """Test a write never authenticates a stale cached user"""
+        self.client.get(ME_URL)
+
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            is_active=False
+        )
+        res = self.client.patch(ME_URL, {'name': 'new'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(self.user.name, 'test')
+
+    def test_update_saves_sent_fields(self):
+        """Test updating the user doesn't write back the other fields"""
+        self.client.get(ME_URL)
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            is_staff=True
+        )
+
+        res = self.client.patch(ME_URL, {'password': 'newpassword123'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_staff)
+        self.assertTrue(self.user.check_password('newpassword123'))
+
+    def test_inactive_user_rejected(self):
+        """Test that deactivating a user stops the cached token"""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class DatabaseVersionCacheTests(TestCase):
+    """Test cached tokens with the versions in the database cache"""
+
+    def setUp(self):
+        caches_setting = dict(settings.CACHES)
+        caches_setting[USER_VERSION_CACHE] = {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'api_response_cache',
+            'KEY_PREFIX': 'auth',
+        }
+        override = self.settings(CACHES=caches_setting)
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('createcachetable', verbosity=0)
+        caches[TOKEN_CACHE].clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass'
+        )
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_cached_token_runs_no_queries(self):
+        """Test a repeated request doesn't query the versions table"""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_inactive_user_rejected(self):
+        """Test that deactivating a user stops the cached token"""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -1,12 +1,19 @@
+from django.conf import settings
 from django.urls import path
 
+from core.async_views import async_read_view
+
 from . import views
 
 
+manage_user_view = views.ManageUserView.as_view()
+if settings.ASYNC_VIEWS:
+    manage_user_view = async_read_view(manage_user_view)
+
 app_name = "user"
 
 urlpatterns = [
     path("create/", views.CreateUserView.as_view(), name="create"),
     path('token/', views.CreateTokenView.as_view(), name='token'),
-    path('me/', views.ManageUserView.as_view(), name='me'),
+    path('me/', manage_user_view, name='me'),
 ]
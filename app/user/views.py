@@ -4,7 +4,7 @@
 # this is a view that's pre-made for us that allows us to
 # easily make a API that contain an object in a database
 # using the serializer that were going to provide
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 # if authenticated using a username and password
 # as standard is easy pass in the ObtainAuthToken view
 # directly into our URLs
@@ -14,6 +14,7 @@ from rest_framework import generics, authentication, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from user.authentication import CachedTokenAuthentication
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
@@ -45,7 +46,7 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     # authentication is the mechanism by which the authentication
     # happens so this could be cokie authentication
     # or token authentication
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     # permissions are the level of access that the user has
     # only permission to add is that the user must be
     # authenticated to use the API they don't have any
@@ -59,5 +60,6 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
         # user attached to it because of the authentication_classes
         # because we have the authentication_classes that takes care
         # of take getting the authentication user and assigning it
-        # to request
+        # to request, for writes CachedTokenAuthentication loads it
+        # from the database rather than the cache
         return self.request.user